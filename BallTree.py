@@ -23,20 +23,94 @@ About This Ball Tree Implementation:
 import math
 import random
 import heapq
+import array
+import ast
+import bisect
+import copy
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+import mmap
+import os
+import sys
+import struct
+import tempfile
+import threading
+import time
+import zipfile
 
 # "Nodes" that support the underlying structure of the Ball Tree
 class Ball(object):
+    
+    # a Ball per point adds up, so leave out the per-instance dictionary
+    __slots__ = ("pivot", "data", "square_rad", "dim", "leftChild", "rightChild", "count", "bounds", "payload", 
+                 "direction")
 
     def __init__(self, pivot, data, rad, dim): 
-        self.pivot = pivot      # tuple of points
+        self.pivot = pivot      # tuple of points (or packed array, see BallTree dtype)
         self.data = data        # data associated with original key
         self.square_rad = rad   # distance between pivot and its furthest subpoint
         self.dim = dim          # the dimension of the data that the roots subpoints
-                                # were split on for this depth
+                                # were split on for this depth (-2 if they were 
+                                # split along a direction instead)
         self.leftChild = None   # reference to left Ball child, resursively assigned
                                 # in construction method
         self.rightChild = None  # reference to right Ball child, resursively assigned
                                 # in construction method
+        self.count = 1          # amount of points in this Ball, including the pivot
+        self.bounds = None      # for a tight tree, (centroid, square radius around it, 
+                                # lowest and highest value in each dimension) of
+                                # the Ball's points
+        self.payload = None     # lowest, highest, and total data of the Ball's 
+                                # points, if they can be compared (and added up)
+                                # (left out for a leaf)
+        self.direction = None   # (direction, pivot's position along it) that the 
+                                # points were split along, if not a dimension
+
+# A Ball of a lazy Ball Tree whose children haven't all been built yet. Until a 
+# child is first reached, its slot holds the list of Balls that will make it up; 
+# reaching it builds just that child (leaving the child's own children for later), 
+# and once both children are built the Ball turns back into a plain Ball
+class LazyBall(Ball):
+    
+    # nothing more than a Ball holds, so it can turn back into one
+    __slots__ = ()
+    
+    # held while a child is built, so that a background build and a query never 
+    # build the same child
+    __lock = threading.Lock()
+    
+    def __getLeft(self): return self.__child(Ball.leftChild)
+    def __getRight(self): return self.__child(Ball.rightChild)
+    def __setLeft(self, child): Ball.leftChild.__set__(self, child)
+    def __setRight(self, child): Ball.rightChild.__set__(self, child)
+    
+    leftChild = property(__getLeft, __setLeft)
+    rightChild = property(__getRight, __setRight)
+    
+    # returns the child in the slot, building it first if it's still a list of Balls
+    def __child(self, slot):
+        
+        child = slot.__get__(self)
+        if not isinstance(child, list): return child
+        
+        with LazyBall.__lock:
+            
+            # another thread may have built it while this one waited
+            child = slot.__get__(self)
+            if isinstance(child, list):
+                child = BallTree._growLazy(child, 1, child.tight, child.split)
+                slot.__set__(self, child)
+            
+            if not isinstance(Ball.leftChild.__get__(self), list) and \
+               not isinstance(Ball.rightChild.__get__(self), list):
+                self.__class__ = Ball
+        
+        return child
+
+# The Balls that a LazyBall's child will be built from, and how to build it
+class _Pending(list):
+    
+    __slots__ = ("tight", "split")
 
 # Class that arranges Ball objects to operate as a Ball Tree
 class BallTree(object):
@@ -44,89 +118,767 @@ class BallTree(object):
     # Ball Tree accessors
     def getSize(self): return self.__size           # amount of nodes in Ball Tree
     def getRadius(self): return math.sqrt(self.__root.square_rad) # radius of root
+    def getDtype(self): return self.__dtype         # storage type of the keys
+    def getDepth(self): return self.__measure(self.__root, {})  # height of the tree, root included
+    def getVersion(self): return self.__version     # amount of times the tree has been changed
 
+    # array typecodes that keys can be packed into, by dtype name
+    __typecodes = {"float32": "f", "float64": "d", "int32": "i"}
     
     # Creates a ball tree from tuples of key/data pairs or a CSV file (*under the 
     # correct conditions)
-    def __init__(self, points):
+    # If a dtype ("float32", "float64", or "int32") is given, each key is stored as
+    # a packed array of that type instead of a tuple of Python numbers; distances 
+    # are then measured on the stored values. Every array still has a header of its
+    # own, so this saves little at a few dimensions and more the more there are
+    # If lazy is True (or a number of levels), only the top level (or levels) of 
+    # the tree is built up front, and each Ball under them is built the first time
+    # a search reaches it
+    # If tight is True, each Ball also keeps a ball around the centroid of its points
+    # and the box around them, and searches prune with whichever bound is tightest
+    # The points are split on the dimension of greatest spread by default, or along
+    # a direction: their principal axis ("pca"), a random one ("random"), or the 
+    # one between two points far apart ("farthest"), which suits high dimensional 
+    # points that are spread out along no single dimension
+    def __init__(self, points, dtype=None, lazy=False, tight=False, split="spread"):
         
-        self.__size = 0
+        self.__setUp(tight)
+        if not self.__setDtype(dtype) or not self.__setSplit(split): return
         
         # if the Ball Tree is initialized with a file name, the data in the CSV
         # needs to be converted to a list of tuples
         if type(points) == type(""): 
             
+            # arrays of keys and data are read straight into Balls
+            if points.endswith(".npy") or points.endswith(".npz"):
+                arrays = BallTree.__readArrays(points)
+                balls = self.__ballsFromArrays(*arrays) if arrays else None
+                if balls is not None: self.__arrange(balls, lazy)
+                return
+            
             if not points.endswith(".csv"):
-                print("Must be a .csv file.")
+                print("Must be a .csv, .npy, or .npz file.")
                 return
             # convert the points into a points file
-            imported = BallTree.__fromFile(points)
-            # initialize the tree with the imported points
-            self.__root = self.__constructBallTree(imported) 
+            points = BallTree.__fromFile(points)
+        
+        # keys are packed before construction so the radii are measured on the 
+        # values that are actually stored
+        if self.__typecode:
+            packed = [(self.__pack(point[0]), point[1]) for point in points]
+            if any(point[0] is None for point in packed):
+                print("Keys must be whole numbers that fit in 32 bits to be stored as int32.")
+                return
+            points = packed
+            
+        # every point gets its Ball up front, and construction arranges them
+        self.__arrange([Ball(point[0], point[1], 0, -1) for point in points], lazy)
+    
+    # Creates a ball tree straight from a flat array of keys, laid out one key after
+    # another, and a list (or array) of the data for each key, without building 
+    # any tuples when a dtype is given. If keys is an array of that dtype, each key
+    # is a slice of it. The keys may also be a 2-D array (n keys by d dimensions),
+    # and either may be anything that exposes its values as a buffer, like a NumPy 
+    # array. The tree can be lazy, tight, or split the same ways as the constructor's
+    def fromArrays(keys, data, dtype=None, lazy=False, tight=False, split="spread"):
+        
+        tree = BallTree.__new__(BallTree)
+        tree.__setUp(tight)
+        if not tree.__setDtype(dtype) or not tree.__setSplit(split): return None
+        
+        keys, shape = BallTree.__fromBuffer(keys)
+        data = BallTree.__fromBuffer(data)[0]
+        
+        balls = tree.__ballsFromArrays(keys, data, shape[1] if len(shape) == 2 else None)
+        if balls is None: return None
+        tree.__arrange(balls, lazy)
+        
+        return tree
+    
+    # makes a Ball for each key in a flat array of keys (dims long each, if known)
+    # and its data, or returns None if they don't match up
+    def __ballsFromArrays(self, keys, data, dims=None):
+        
+        if len(data) == 0 or len(keys) != len(data) * (dims or len(keys) // len(data)):
+            print("Must have the same amount of keys and data.")
+            return None
+        dims = len(keys) // len(data)
+        
+        balls = []
+        for i in range(len(data)):
+            
+            key = keys[i * dims:(i + 1) * dims]
+            if not self.__typecode: key = tuple(key)
+            elif not isinstance(key, array.array) or key.typecode != self.__typecode: 
+                key = self.__pack(key)
+                if key is None:
+                    print("Keys must be whole numbers that fit in 32 bits to be stored as int32.")
+                    return None
+                
+            balls += [Ball(key, data[i], 0, -1)]
+        
+        return balls
+    
+    # returns the values of anything that keeps them in a buffer (a NumPy array, 
+    # say) as a flat array, row after row, with the buffer's shape. Values that 
+    # aren't in a buffer, or are in a list or an array already, are left as they are
+    def __fromBuffer(values):
+        
+        if isinstance(values, (list, tuple, array.array)): return values, (len(values),)
+        
+        try: view = memoryview(values)
+        except TypeError: return values, (len(values),)
+        
+        # a buffer of single native numbers is copied across as is, and anything 
+        # else is converted one value at a time
+        code = view.format.lstrip("@")
+        if len(code) == 1 and code in "bBhHiIlLqQfd" and view.c_contiguous:
+            flat = array.array(code)
+            flat.frombytes(view.cast("B"))
+        else:
+            flat = view.tolist()
+            for i in range(1, view.ndim): flat = [value for row in flat for value in row]
+        
+        return flat, view.shape
+    
+    # sets up what every Ball Tree starts with, before its Balls are arranged
+    def __setUp(self, tight):
+        
+        self.__size = 0
+        self.__tight = tight
+        self.__kRadii = {}      # k-th nearest neighbor distances (and their root), by k
+        self.__version = 0
+        self.__frozen = False   # snapshots can't be changed
+        
+        # the one writer changing the tree holds the first, and only while the new
+        # version is put in place does it hold the second, which snapshots take too
+        self.__writing = threading.Lock()
+        self.__publishing = threading.Lock()
+    
+    # checks and stores the dtype the keys will be packed into
+    def __setDtype(self, dtype):
+        
+        if dtype and dtype not in BallTree.__typecodes:
+            print("dtype must be one of float32, float64, or int32.")
+            return False
+        
+        self.__dtype = dtype
+        self.__typecode = BallTree.__typecodes.get(dtype)
+        
+        return True
+    
+    # ways the points can be split
+    __splits = ("spread", "pca", "random", "farthest")
+    
+    # checks and stores the way the points will be split
+    def __setSplit(self, split):
+        
+        if split not in BallTree.__splits:
+            print("split must be one of spread, pca, random, or farthest.")
+            return False
+        
+        self.__split = split
+        
+        return True
+    
+    # arranges the Balls into the tree, either all at once or, if lazy, only the top
+    # levels (True being one level)
+    def __arrange(self, balls, lazy):
+        
+        if not lazy: 
+            self.__root = self.__constructBallTree(balls)
+            self.__size = self.__root.count
+            return
+        
+        # repeated keys are dropped up front instead of as the tree is built, so 
+        # the size and the Balls' counts are right before everything is built
+        unique = {}
+        for b in balls: unique.setdefault(tuple(b.pivot), b)
+        
+        self.__size = len(unique)
+        self.__root = BallTree._growLazy(list(unique.values()), int(lazy), self.__tight, self.__split)
+    
+    # Builds every Ball of a lazy tree that hasn't been built yet. If background is 
+    # True it's built in a separate thread, which is returned, and the tree can be
+    # searched while it builds
+    def build(self, background=False):
+        
+        if not background:
+            BallTree.__balls(self.__root)
+            return None
+        
+        # reaching every Ball builds it
+        thread = threading.Thread(target=BallTree.__balls, args=(self.__root,), daemon=True)
+        thread.start()
+        
+        return thread
+    
+    # Rebuilds the whole tree from the Balls it already has, splitting at the 
+    # exact median so it comes out as shallow as it can be
+    # Like update, it builds a new version of the tree out of copies of the Balls
+    def rebuild(self):
+        
+        if not self.__canChange(): return
+        
+        with self.__writing:
+            balls = [BallTree.__fresh(b) for b in BallTree.__balls(self.__root)]
+            self.__publish(self.__constructBallTree(balls, True))
+    
+    # Rebuilds only the subtrees that are more than slack times as deep as the 
+    # shallowest tree that could hold their points, splitting them at the exact median
+    def rebalance(self, slack=2):
+        
+        if not self.__canChange(): return
+        
+        with self.__writing:
+            heights = {}
+            self.__measure(self.__root, heights)
+            self.__publish(self.__rebalance(self.__root, heights, slack))
+    
+    # recursively rebuilds the subtrees under Ball b that are too deep, copying the
+    # Balls on the way to them
+    def __rebalance(self, b, heights, slack):
+        
+        if heights[b] > slack * math.ceil(math.log2(b.count + 1)):
+            return self.__constructBallTree([BallTree.__fresh(point) for point in BallTree.__balls(b)], True)
+        
+        left = self.__rebalance(b.leftChild, heights, slack) if b.leftChild else None
+        right = self.__rebalance(b.rightChild, heights, slack) if b.rightChild else None
+        
+        if left is b.leftChild and right is b.rightChild: return b
+        return BallTree.__copy(b, b.data, left, right)
+    
+    # Changes the tree by a batch of inserts (key and data pairs; a key that's 
+    # already in the tree gets the new data) and deletes (keys), deletes first
+    # No Ball already in the tree is changed: the Balls on the way to each change 
+    # are copied, a subtree whose pivot is deleted is rebuilt from copies, and the 
+    # new root is put in place all at once when the batch is done. So queries 
+    # already under way and snapshots carry on with the version they started 
+    # with, without waiting. One update (or rebuild or rebalance) runs at a time
+    # Radii and tight bounds grow to fit inserts but don't shrink after deletes, 
+    # so a tree that's changed a lot may search faster once it's rebuilt
+    def update(self, inserts=(), deletes=()):
+        
+        if not self.__canChange(): return
+        
+        # keys are compared the way the tree stores them, and only once each 
+        # (the last data given for a key is the one it gets)
+        adds, removes = {}, {}
+        for key, data in inserts:
+            key = self.__keyOf(key)
+            if key is None: return
+            adds[tuple(key)] = (key, data)
+        for key in deletes:
+            key = self.__keyOf(key)
+            if key is None: return
+            removes[tuple(key)] = key
+        
+        with self.__writing:
+            
+            root = self.__root
+            if removes: root = self.__remove(root, list(removes.values()), set(removes))
+            
+            if adds: 
+                if root: root = self.__insert(root, list(adds.values()))
+                else: root = self.__constructBallTree([Ball(key, data, 0, -1) for key, data in adds.values()])
+            
+            if not root:
+                print("A Ball Tree can't be left empty.")
+                return
+            
+            self.__publish(root)
+    
+    # Returns the tree as it is now: it shares every Ball with the tree, but stays 
+    # the same however the tree is changed afterwards, and can be searched from 
+    # any amount of threads. It can't be changed itself
+    def snapshot(self):
+        
+        with self.__publishing: snapshot = copy.copy(self)
+        snapshot.__frozen = True
+        
+        return snapshot
+    
+    # whether the tree can be changed (it can't be if it's a snapshot)
+    def __canChange(self):
+        
+        if self.__frozen: print("A snapshot can't be changed.")
+        
+        return not self.__frozen
+    
+    # puts a new version of the tree in place
+    def __publish(self, root):
+        
+        with self.__publishing:
+            self.__root, self.__size, self.__kRadii = root, root.count, {}
+            self.__version += 1
+    
+    # a key to update the tree with, stored the way the tree stores its keys, or 
+    # None if it can't be
+    def __keyOf(self, key):
+        
+        if len(key) != len(self.__root.pivot):
+            print("Keys must have the same dimensions as the tree's.")
+            return None
+        
+        packed = self.__pack(key) if self.__typecode else tuple(key)
+        if packed is None: print("Keys must be whole numbers that fit in 32 bits to be stored as int32.")
+        
+        return packed
+    
+    # removes the keys (the ones that lead to Ball b) and any of the keys gone under
+    # it, returning what's left: b itself if none of the keys are under it, a copy 
+    # of it on the way to them, the subtree rebuilt if b's own key is one of them, 
+    # or None if no points are left
+    def __remove(self, b, keys, gone):
+        
+        if any(key == b.pivot for key in keys):
+            rest = [BallTree.__fresh(point) for point in BallTree.__balls(b) if tuple(point.pivot) not in gone]
+            return self.__constructBallTree(rest) if rest else None
+        
+        left, right = [], []
+        for key in keys: 
+            if BallTree.__goesLeft(b, key): left.append(key)
+            else: right.append(key)
+        
+        newLeft = self.__remove(b.leftChild, left, gone) if left and b.leftChild else b.leftChild
+        newRight = self.__remove(b.rightChild, right, gone) if right and b.rightChild else b.rightChild
+        
+        if newLeft is b.leftChild and newRight is b.rightChild: return b
+        return BallTree.__copy(b, b.data, newLeft, newRight)
+    
+    # adds the points (key and data pairs that lead to Ball b) under it, returning 
+    # a copy of it that holds them
+    def __insert(self, b, points):
+        
+        # a leaf is built again along with them (unless its own key is replaced)
+        if not b.leftChild and not b.rightChild:
+            balls = [Ball(key, data, 0, -1) for key, data in points]
+            if not any(key == b.pivot for key, data in points): balls += [BallTree.__fresh(b)]
+            return self.__constructBallTree(balls)
+        
+        data = b.data
+        left, right = [], []
+        for key, value in points:
+            if key == b.pivot: data = value
+            elif BallTree.__goesLeft(b, key): left.append((key, value))
+            else: right.append((key, value))
+        
+        children = []
+        for child, points in ((b.leftChild, left), (b.rightChild, right)):
+            if points and child: child = self.__insert(child, points)
+            elif points: child = self.__constructBallTree([Ball(key, value, 0, -1) for key, value in points])
+            children += [child]
+        
+        c = BallTree.__copy(b, data, children[0], children[1])
+        
+        # the Ball's bounds grow to take in the new points
+        keys = [key for key, value in left + right]
+        if keys: c.square_rad = max([c.square_rad] + [_squareDist(key, b.pivot) for key in keys])
+        if keys and c.bounds: c.bounds = BallTree.__widen(c.bounds, keys)
+        
+        return c
+    
+    # a copy of Ball b with the data and children given, leaving b as it is for the
+    # versions of the tree that still have it; with no children it's a leaf
+    def __copy(b, data, left, right):
+        
+        if not left and not right: return Ball(b.pivot, data, 0, -1)
+        
+        c = Ball(b.pivot, data, b.square_rad, b.dim)
+        c.leftChild, c.rightChild = left, right
+        c.count = 1 + (left.count if left else 0) + (right.count if right else 0)
+        c.bounds, c.direction = b.bounds, b.direction
+        c.payload = BallTree.__summarize([data], [left, right])
+        
+        return c
+    
+    # a new Ball for Ball b's point alone, for building a subtree out of
+    def __fresh(b): return Ball(b.pivot, b.data, 0, -1)
+    
+    # a tight tree's bounds for a Ball, grown to take in the keys: the ball 
+    # around the centroid keeps its center, and the box stretches
+    def __widen(bounds, keys):
+        
+        center, sqRad, lo, hi = bounds
+        lo, hi = list(lo), list(hi)
+        
+        for key in keys:
+            sqRad = max(sqRad, _squareDist(key, center))
+            for i in range(len(key)):
+                if key[i] < lo[i]: lo[i] = key[i]
+                elif key[i] > hi[i]: hi[i] = key[i]
+        
+        if isinstance(center, array.array): return center, sqRad, array.array("d", lo), array.array("d", hi)
+        return center, sqRad, tuple(lo), tuple(hi)
+    
+    # returns the height of Ball b, and records the height of every Ball under it
+    # (the Balls are visited children first, without recursion, since this is 
+    # used on trees that may be too deep to recurse through)
+    def __measure(self, b, heights):
+        
+        stack = [(b, False)]
+        
+        while stack:
+            
+            b, visited = stack.pop()
+            children = [child for child in (b.leftChild, b.rightChild) if child]
+            
+            if visited: heights[b] = 1 + max([heights[child] for child in children] + [0])
+            else:
+                stack.append((b, True))
+                for child in children: stack.append((child, False))
+        
+        return heights[b]
+    
+    # returns a list of every Ball under Ball b, without recursion
+    def __balls(b):
+        
+        balls = []
+        stack = [b]
+        
+        while stack:
+            b = stack.pop()
+            balls += [b]
+            if b.leftChild: stack.append(b.leftChild)
+            if b.rightChild: stack.append(b.rightChild)
             
-        else: # the ball tree can be constructed with points because it's already a tuple list
-            self.__root = self.__constructBallTree(points)   
+        return balls
+    
+    # stores a key the way the tree stores its keys: as given, or packed into an
+    # array of the tree's dtype. Returns None if the key can't be stored that way
+    def __pack(self, key):
+        
+        if not self.__typecode: return key
+        
+        return _packKey(self.__typecode, key)
     
     
     # Recursive construction algorithim for the ball tree
-    # Input is a list of point/data tuples that have not already turned into nodes
-    def __constructBallTree(self, points):
+    # Input is a list of Balls (new ones or ones taken from a tree) that are 
+    # arranged into a tree; the pivots are found with the median of 3, or with the 
+    # exact median if exact is True
+    def __constructBallTree(self, points, exact=False):
                
         # If there's only one point in the input list (this will be a leaf node)
         if len(points) == 1:
             
-            # initialize a new ball
-            b = Ball(points[0][0], points[0][1], 0, -1) # radius of 0 for leaf node
-                                                               # dim of spread is -1 (no other points to compare)
-            self.__size += 1                               # increment size whenever a new Ball is created
+            # reset the ball as a leaf
+            b = points[0]
+            b.square_rad, b.dim = 0, -1                    # radius of 0 for leaf node
+                                                           # dim of spread is -1 (no other points to compare)
+            b.leftChild = b.rightChild = None
+            b.count = 1
+            b.bounds = b.payload = b.direction = None
             
             return b # returns to its parent one layer up
                 
         else:
-            # calculate the dimension of greatest spread among the points
-            maxDim = BallTree.__dimGreatestSpread(points)
+            # set up the pivot's Ball and the lists of points for its children
+            b, l, r = BallTree.__splitPoints(points, exact, self.__split)
+            b.bounds = BallTree.__bounds(points) if self.__tight else None
             
-            # find the pivot point for the new Ball based on the dimension of greatest spread
-            pivot, data = BallTree.__pivotPoint(points, maxDim)
+            # create its children based on the l and r lists
+            b.leftChild = self.__constructBallTree(l, exact) if len(l) > 0 else None
+            b.rightChild = self.__constructBallTree(r, exact) if len(r) > 0 else None
+            b.count = 1 + (b.leftChild.count if b.leftChild else 0) + (b.rightChild.count if b.rightChild else 0)
+            b.payload = BallTree.__summarize([b.data], [b.leftChild, b.rightChild])
             
-            # initialize lists of points for that will be passed to the left and right children, 
-            # and start tracking the radius
-            l, r = [],[]
-            rad = 0 
+            return b # return reference of root node to the init
+    
+    # picks the pivot of a list of two or more Balls and sets up its Ball, returning
+    # it with the lists of Balls that go to its left and right children
+    def __splitPoints(points, exact, split="spread"):
+        
+        # points split along a direction go left if they're before the pivot along
+        # it, with everything else the same as a split on a dimension
+        direction = BallTree.__direction(points, split)
+        if direction: return BallTree.__splitAlong(points, exact, direction)
+        
+        # calculate the dimension of greatest spread among the points
+        maxDim = BallTree.__dimGreatestSpread(points)
+        
+        # find the pivot point for the new Ball based on the dimension of greatest spread
+        if exact: b = BallTree.__medianPoint(points, maxDim)
+        else: b = BallTree.__pivotPoint(points, maxDim)
+        pivot = b.pivot
+        
+        # initialize lists of points for that will be passed to the left and right children, 
+        # and start tracking the radius
+        l, r = [],[]
+        rad = 0 
+        
+        # go through all the points to sort to left or right children           
+        for point in points:
             
-            # go through all the points to sort to left or right children           
-            for point in points:
+            # not passing a pivot (or any copy of its key) to its children 
+            if point.pivot != pivot: 
                 
-                # not passing a pivot to its children 
-                if point[0] != pivot: 
-                    
-                    # store largest distance between the current point and pivot
-                    # as the radius
-                    rad = max(rad, BallTree.__squareDist(point[0], pivot))
-                    
-                    # assign each point to left child or right child if its 
-                    # less than or greater than the value of the pivot point on 
-                    # the dimension of maximum spread
-                    if point[0][maxDim] < pivot[maxDim]: l.append(point)
-                    else: r.append(point)
-                    
-            
-            # initialize new Ball
-            b = Ball(pivot, data, rad, maxDim)
-            self.__size += 1
+                # store largest distance between the current point and pivot
+                # as the radius
+                rad = max(rad, _squareDist(point.pivot, pivot))
+                
+                # assign each point to left child or right child if its 
+                # less than or greater than the value of the pivot point on 
+                # the dimension of maximum spread
+                if point.pivot[maxDim] < pivot[maxDim]: l.append(point)
+                else: r.append(point)
+        
+        b.square_rad, b.dim = rad, maxDim
+        b.direction = None
+        
+        return b, l, r
+    
+    # splits a list of two or more Balls along a direction, the same way they're
+    # split on a dimension
+    def __splitAlong(points, exact, direction):
+        
+        values = [BallTree.__dot(point.pivot, direction) for point in points]
+        
+        # the pivot is in the middle along the direction: the median of 3, or the 
+        # exact median (the first of the points at the same place as it, so the 
+        # left and right are as even as they can be)
+        if exact:
+            order = sorted(range(len(points)), key=values.__getitem__)
+            median = len(order) // 2
+            while median > 0 and values[order[median - 1]] == values[order[median]]: median -= 1
+            index = order[median]
+        else: 
+            index = sorted([0, len(points) // 2, len(points) - 1], key=values.__getitem__)[1]
+        
+        b = points[index]
+        pivot, threshold = b.pivot, values[index]
+        
+        l, r = [], []
+        rad = 0
+        
+        for i in range(len(points)):
             
-            # create its children based on the l and r lists
-            if len(l) > 0: b.leftChild = self.__constructBallTree(l)
-            if len(r) > 0: b.rightChild = self.__constructBallTree(r)
+            point = points[i]
+            if point.pivot != pivot:
+                rad = max(rad, _squareDist(point.pivot, pivot))
+                if values[i] < threshold: l.append(point)
+                else: r.append(point)
+        
+        b.square_rad, b.dim = rad, -2
+        b.direction = (direction, threshold)
+        
+        return b, l, r
+    
+    # returns the direction to split a list of two or more Balls along, as an array 
+    # of doubles, or None to split them on the dimension of greatest spread (which 
+    # is also done when the points are all at the same place along the direction)
+    def __direction(points, split):
+        
+        if split == "spread": return None
+        nDims = len(points[0].pivot)
+        
+        if split == "random": direction = [random.gauss(0, 1) for i in range(nDims)]
+        
+        else:
+            # two points far apart: the farthest from a random point, and the 
+            # farthest from that one
+            sample = points if split == "farthest" else random.sample(points, min(len(points), 64))
+            start = random.choice(sample).pivot
+            a = max(sample, key=lambda point: _squareDist(point.pivot, start)).pivot
+            b = max(sample, key=lambda point: _squareDist(point.pivot, a)).pivot
+            direction = [b[i] - a[i] for i in range(nDims)]
             
-            return b # return reference of root node to the init
+            # the principal axis of a sample of the points, by power iteration on
+            # their covariance starting from the direction between those two
+            if split == "pca":
+                
+                mean = [sum(point.pivot[i] for point in sample) / len(sample) for i in range(nDims)]
+                centered = [[point.pivot[i] - mean[i] for i in range(nDims)] for point in sample]
+                
+                for step in range(4):
+                    length = math.sqrt(BallTree.__dot(direction, direction))
+                    if length == 0: break
+                    direction = [value / length for value in direction]
+                    
+                    spread = [0] * nDims
+                    for point in centered:
+                        along = BallTree.__dot(point, direction)
+                        for i in range(nDims): spread[i] += along * point[i]
+                    direction = spread
+        
+        length = math.sqrt(BallTree.__dot(direction, direction))
+        if length == 0: return None
+        direction = array.array("d", [value / length for value in direction])
+        
+        # points that are all at the same place along it can't be split along it
+        first = BallTree.__dot(points[0].pivot, direction)
+        if all(BallTree.__dot(point.pivot, direction) == first for point in points): return None
+        
+        return direction
+    
+    # whether a key goes to the left child of Ball b
+    def __goesLeft(b, key):
+        
+        if b.direction: return BallTree.__dot(key, b.direction[0]) < b.direction[1]
+        
+        return key[b.dim] < b.pivot[b.dim]
+    
+    # dot product of two keys
+    def __dot(a, b):
+        
+        total = 0
+        for i in range(len(a)): total += a[i] * b[i]
+        
+        return total
+    
+    # Builds the given amount of levels of a lazy tree from a list of Balls with 
+    # no repeated keys, and returns its root. The children below those levels are 
+    # left as lists of Balls, which LazyBall builds (with this) when they're reached
+    def _growLazy(points, levels, tight, split):
+        
+        if len(points) == 1:
+            b = points[0]
+            b.square_rad, b.dim = 0, -1
+            b.leftChild = b.rightChild = None
+            b.count = 1
+            b.bounds = b.payload = b.direction = None
+            return b
+        
+        b, l, r = BallTree.__splitPoints(points, False, split)
+        b.count = len(points)
+        b.bounds = BallTree.__bounds(points) if tight else None
+        b.payload = BallTree.__summarize([point.data for point in points], [])
+        
+        if levels > 1:
+            b.leftChild = BallTree._growLazy(l, levels - 1, tight, split) if l else None
+            b.rightChild = BallTree._growLazy(r, levels - 1, tight, split) if r else None
+        else:
+            b.leftChild, b.rightChild = BallTree.__pending(l, tight, split), BallTree.__pending(r, tight, split)
+            if l or r: b.__class__ = LazyBall
+        
+        return b
+        
+    # the pending child a lazy tree makes of a list of Balls, or None if it's empty
+    def __pending(points, tight, split):
+        
+        if not points: return None
+        
+        pending = _Pending(points)
+        pending.tight, pending.split = tight, split
+        
+        return pending
+        
+    # the payload summary of a Ball, from the data of some of its points and the 
+    # summaries of Balls holding the rest (any of which may be None), or None if
+    # the data can't be compared; the total is None if the data can't be added up
+    def __summarize(data, balls):
+        
+        payloads = [BallTree.__payload(b) for b in balls if b]
+        if None in payloads: return None
+        
+        try:
+            lo = min([value for value in data] + [payload[0] for payload in payloads])
+            hi = max([value for value in data] + [payload[1] for payload in payloads])
+        except TypeError: return None
+        
+        try: total = sum(data) + sum(payload[2] for payload in payloads)
+        except TypeError: total = None
+        
+        return lo, hi, total
+    
+    # the lowest, highest, and total data of Ball b's points, or None if they 
+    # aren't known
+    def __payload(b):
+        
+        if b.count == 1: return b.data, b.data, b.data
+        
+        return b.payload
+    
+    # whether data passes a query's filters: within the range (if there is one) 
+    # and accepted by the predicate (if there is one). Data that can't be compared
+    # with the range isn't within it
+    def __passes(data, dataRange, predicate):
+        
+        try:
+            if dataRange and not dataRange[0] <= data <= dataRange[1]: return False
+        except TypeError: return False
+        
+        return not predicate or predicate(data)
+    
+    # whether any of Ball b's points could have data within the range, which they
+    # could if their data can't be compared with it
+    def __mayPass(b, dataRange):
+        
+        if not dataRange: return True
+        
+        payload = BallTree.__payload(b)
+        
+        try: return payload is None or (payload[1] >= dataRange[0] and payload[0] <= dataRange[1])
+        except TypeError: return True
+    
+    # the bounds a tight tree keeps for a Ball holding the given Balls: the centroid 
+    # of their keys and the square radius around it, and the corners of the box 
+    # around them. They're stored as tuples, or as arrays of doubles for packed keys
+    def __bounds(points):
+        
+        nDims = len(points[0].pivot)
+        lo, hi = list(points[0].pivot), list(points[0].pivot)
+        total = [0] * nDims
+        
+        for point in points:
+            for i in range(nDims):
+                value = point.pivot[i]
+                total[i] += value
+                if value < lo[i]: lo[i] = value
+                elif value > hi[i]: hi[i] = value
+        
+        center = [value / len(points) for value in total]
+        rad = max(_squareDist(point.pivot, center) for point in points)
+        
+        if isinstance(points[0].pivot, array.array): 
+            return array.array("d", center), rad, array.array("d", lo), array.array("d", hi)
+        return tuple(center), rad, tuple(lo), tuple(hi)
+    
+    # least square distance from a point to anything inside Ball b, given the 
+    # square distance from the point to the Ball's pivot; for a tight tree this 
+    # is the largest of the bounds from its pivot ball, its centroid ball, and its box
+    def __minSqDist(point, b, curDist):
+        
+        bound = _lowerBound(curDist, b.square_rad)
+        if not b.bounds: return bound
         
-    # takes a list of tuples of the tuple keys, data
+        center, sqRad, lo, hi = b.bounds
+        bound = max(bound, _lowerBound(_squareDist(point, center), sqRad))
+        
+        # the distance to the box is added up one dimension at a time like the 
+        # distance to a point, so rounding can't put it past any point in the box
+        gap = 0
+        for i in range(len(point)):
+            if point[i] < lo[i]: gap += (lo[i] - point[i]) ** 2
+            elif point[i] > hi[i]: gap += (point[i] - hi[i]) ** 2
+        
+        return max(bound, gap)
+    
+    # greatest square distance from a point to anything inside Ball b, given the 
+    # square distance from the point to the Ball's pivot; for a tight tree this is 
+    # the smallest of the bounds from its pivot ball, its centroid ball, and its box
+    def __maxSqDist(point, b, curDist):
+        
+        bound = _upperBound(curDist, b.square_rad)
+        if not b.bounds: return bound
+        
+        center, sqRad, lo, hi = b.bounds
+        bound = min(bound, _upperBound(_squareDist(point, center), sqRad))
+        
+        # the distance to the box's farthest corner, added up like the distance to 
+        # a point so that no point in the box can round past it
+        gap = 0
+        for i in range(len(point)):
+            gap += max((point[i] - lo[i]) ** 2, (point[i] - hi[i]) ** 2)
+        
+        return min(bound, gap)
+    
+    # takes a list of Balls
     # address for list of 2 or greater, one or less
     def __dimGreatestSpread(points): 
         
-        # determine number of dimensions by via length of the tuple "points" key
-        nDims = len(points[0][0]) - 1
+        # determine number of dimensions by via length of the Balls' keys
+        nDims = len(points[0].pivot)
         
         # initialize lists to negative and positive infinities to determine the 
         # min and max values of each dimension in the keys
@@ -137,8 +889,8 @@ class BallTree(object):
             for i in range(nDims):
                 
                 # store the minumum and maximums of each dimension                
-                if key[0][i] < listMins[i]: listMins[i] = key[0][i]
-                if key[0][i] > listMaxs[i]: listMaxs[i] = key[0][i]
+                if key.pivot[i] < listMins[i]: listMins[i] = key.pivot[i]
+                if key.pivot[i] > listMaxs[i]: listMaxs[i] = key.pivot[i]
         
         # the difference between mins and maxs is the spread, keep track of max spread
         # and the dimension in which it is found
@@ -165,14 +917,31 @@ class BallTree(object):
         pivot = keys[len(keys)//2]
 
         # select pivot using median of three 
-        if pivot[0][dim] < left[0][dim]: pivot, left = left, pivot
-        if right[0][dim] < left[0][dim]: right, left = left, right
-        if pivot[0][dim] < right[0][dim]: right, pivot = pivot, right
+        if pivot.pivot[dim] < left.pivot[dim]: pivot, left = left, pivot
+        if right.pivot[dim] < left.pivot[dim]: right, left = left, right
+        if pivot.pivot[dim] < right.pivot[dim]: right, pivot = pivot, right
         
         return pivot
     
+    # find pivot using the exact median, which halves the points
+    def __medianPoint(keys, dim):
+        
+        keys = sorted(keys, key=lambda b: b.pivot[dim])
+        median = len(keys)//2
+        
+        # points equal to the pivot on the dimension go to the right, so use the 
+        # first of them to keep the left and right as even as they can be
+        while median > 0 and keys[median - 1].pivot[dim] == keys[median].pivot[dim]: median -= 1
+        
+        return keys[median]
+    
     # returns the data at the queried point
     def find(self, key):
+        
+        # compare with the stored keys in their own precision
+        key = self.__pack(key)
+        if key is None: return None
+        
         return self.__findData(key, self.__root)
     
     # recursively searches for the queried point and returns its data or None
@@ -195,116 +964,791 @@ class BallTree(object):
         # to the value of the value of the pivot on the dimension, and recurse to 
         # the left or right based on if it's greater or less than the pivot, mirroring
         # the construction algorithm
-        if key[b.dim] < b.pivot[b.dim]: return self.__findData(key, b.leftChild)
+        if BallTree.__goesLeft(b, key): return self.__findData(key, b.leftChild)
         else: return self.__findData(key, b.rightChild)    
 
     # wrapper class; extracts just points from a list of distances and points
-    def nearestNeighbors(self, point, k=1):
+    # Only points whose data is within dataRange (lowest, highest), if given, and 
+    # that predicate(data) accepts, if given, are counted as neighbors; Balls none 
+    # of whose data is within the range are skipped whole
+    # If a deadline (in seconds) or a most Balls to visit (maxNodes) is given, 
+    # the search stops once it runs out, and returns the closest points it found 
+    # along with whether they're certain to be the nearest (see __budget)
+    def nearestNeighbors(self, point, k=1, dataRange=None, predicate=None, deadline=None, maxNodes=None):
+        
+        # the whole search is of the version of the tree there is when it starts
+        root = self.__root
         
         # point must be of the same dimensions of the tree to be searchable
-        if len(point) != len(self.__root.pivot): return None
+        if len(point) != len(root.pivot): return None
+        if dataRange and dataRange[0] > dataRange[1]: return None
+        
+        budget = BallTree.__budget(deadline, maxNodes)
         
         nearestNeighors = [ ]
-        if k < 1: return nearestNeighors # need to search for at least 1 neighbor
+        if k < 1: return nearestNeighors if budget is None else (nearestNeighors, True)
 
+        point = _queryKey(self.__typecode, point)
         
-        # recursively search for k nearest neighbors
-        ans = self.__knn(point, k, [], self.__root)
-        
-        # put answers in order of closest distance (un-heapify)
-        # sort so the answer can be compared with the Fake BallTree        
-        ans.sort()
+        # best-first search for k nearest neighbors, which are found already 
+        # in order of closest distance
+        ans = self.__knn(root, point, k, dataRange, predicate, budget)
         
         # extract just the points for answer
-        nearestNeighors = [node[1] for node in ans]
+        nearestNeighors = [tuple(node[1]) for node in ans]
         
-        return nearestNeighors    
+        if budget is None: return nearestNeighors
+        return nearestNeighors, not budget[2]
     
-    # recursive search for k nearest neighbors
-    def __knn(self, point, k, q, b): 
+    # best-first search for k nearest neighbors
+    # A single priority queue holds Balls, ordered by the least distance any of 
+    # their points could be from the query point, and points, ordered by their 
+    # actual distance. Points therefore come off the queue closest first and the 
+    # search is over as soon as the k-th one does
+    # If the budget runs out first, the closest points queued so far fill in the rest
+    def __knn(self, root, point, k, dataRange=None, predicate=None, budget=None): 
+        
+        ans = []
         
-        # distance between current point and query point
-        curDist = BallTree.__squareDist(point, b.pivot)
+        # queue entries are (distance, 0 for a Ball or 1 for a point, tie breaker, 
+        # Ball, square distance to the Ball's pivot); at equal distances Balls come 
+        # first so their points can still be ordered by key like the Fake BallTree
+        curDist = _squareDist(point, root.pivot)
+        q = [(0, 0, 0, root, curDist)]
+        count = 1   # tie breaker between Balls, which can't be compared
         
-        # if current node is a leaf node
-        if not b.leftChild and not b.rightChild:
+        while q and len(ans) < k:
             
-            # a point cannot be its own nearest neighbor 
-            if curDist != 0:
-                
-                # accumulate k distances 
-                if len(q) < k: heapq.heappush(q, (curDist, b.pivot))
-                else: 
-                    # if the length exceeds k, save k smallest distances 
-                    heapq.heappush(q, (curDist, b.pivot))
-                    q = heapq.nsmallest(k, q)
-            return q
-                
-        # a point cannot be its own nearest neighbor         
-        if curDist != 0:
+            dist, isPoint, key, b, curDist = heapq.heappop(q)
             
-            # accumulate k distances
-            if len(q) < k: heapq.heappush(q, (curDist, b.pivot))
-            else: 
-                # if the length exceeds k, save k smallest distances 
-                heapq.heappush(q, (curDist, b.pivot))
-                q = heapq.nsmallest(k, q)
-        
-        # if the children exist, check their pivots' distances
-        if b.leftChild: q = self.__knn(point, k, q, b.leftChild)
-        if b.rightChild: q = self.__knn(point, k, q, b.rightChild)
-        
-        return q
+            # no Ball left in the queue can hold a closer point than this one
+            if isPoint: 
+                ans += [(dist, key)]
+                continue
+            
+            if budget and not BallTree.__spend(budget):
+                ans += sorted((entry[0], entry[2]) for entry in q if entry[1])[:k - len(ans)]
+                break
+            
+            # a point cannot be its own nearest neighbor 
+            if curDist != 0 and BallTree.__passes(b.data, dataRange, predicate): 
+                heapq.heappush(q, (curDist, 1, b.pivot, None, None))
             
+            # queue the children by how close their points could possibly be
+            for child in (b.leftChild, b.rightChild):
+                if child and BallTree.__mayPass(child, dataRange):
+                    childDist = _squareDist(point, child.pivot)
+                    bound = BallTree.__minSqDist(point, child, childDist)
+                    heapq.heappush(q, (bound, 0, count, child, childDist))
+                    count += 1
         
-    # returns a list of nodes within a certain radius from a point
-    def countRadius(self, point, radius):
+        return ans
+    
+    # returns a list of the k points farthest from the point, farthest first
+    def farthestNeighbors(self, point, k=1):
         
-        # must be a valid point and radius
-        if len(point) != len(self.__root.pivot) or radius <= 0: return None
+        root = self.__root
         
-        withinRadius = self.__inRadius(point, radius**2, self.__root, [])
+        # point must be of the same dimensions of the tree to be searchable
+        if len(point) != len(root.pivot): return None
+        if k < 1: return []
         
-        # sort so the answer can be compared with the Fake BallTree
-        withinRadius.sort()
+        point = _queryKey(self.__typecode, point)
         
-        return withinRadius
-    
+        return [tuple(node[1]) for node in self.__kfn(root, point, k)]
     
-    # recursive searches for the neighbors within sqRad of point
-    def __inRadius(self, point, sqRad, b, ans):
+    # best-first search for k farthest neighbors, the mirror image of __knn: Balls 
+    # are ordered by the greatest distance any of their points could be from the
+    # query point, so points come off the queue farthest first
+    def __kfn(self, root, point, k):
+        
+        ans = []
         
-        # if it's not the same point
-        if point != b.pivot:  
+        # distances are negated so the farthest comes off the queue first
+        curDist = _squareDist(point, root.pivot)
+        q = [(-BallTree.__maxSqDist(point, root, curDist), 0, 0, root, curDist)]
+        count = 1
         
-            # if Ball b is a leaf-node
-            if not b.leftChild and not b.rightChild: 
-                
-                # if the distance is within the sqRad, append 
-                if BallTree.__squareDist(point, b.pivot) < sqRad:
-                    ans += [b.pivot]
-                    return ans
+        while q and len(ans) < k:
             
-            # if the distance is within the sqRad, append 
-            if BallTree.__squareDist(point, b.pivot) < sqRad:
-                ans += [b.pivot]
+            dist, isPoint, key, b, curDist = heapq.heappop(q)
             
-        # call on children
-        if b.leftChild: ans = self.__inRadius(point, sqRad, b.leftChild, ans)
-        if b.rightChild: ans = self.__inRadius(point, sqRad, b.rightChild, ans)
+            # no Ball left in the queue can hold a farther point than this one
+            if isPoint: 
+                ans += [(-dist, key)]
+                continue
+            
+            # a point cannot be its own farthest neighbor either
+            if curDist != 0: heapq.heappush(q, (-curDist, 1, b.pivot, None, None))
+            
+            for child in (b.leftChild, b.rightChild):
+                if child:
+                    childDist = _squareDist(point, child.pivot)
+                    bound = BallTree.__maxSqDist(point, child, childDist)
+                    heapq.heappush(q, (-bound, 0, count, child, childDist))
+                    count += 1
         
-        return ans            
-           
-    # converts data from a CSV to a list of tuples and data for Ball Tree construction
-    def __fromFile(filename):
+        return ans
+    
+    # returns a sorted list of the points that have the point among their k nearest
+    # neighbors, i.e. that are no farther from it than from their own k-th nearest 
+    # neighbor in the tree (every point does if the tree has no more than k others)
+    # The first query for a k finds every point's k-th nearest neighbor, and each 
+    # Ball keeps the largest of those distances under it, so Balls too far from 
+    # the query for any of their points to reach it are skipped whole
+    def reverseNearestNeighbors(self, point, k=1):
+        
+        root = self.__root
+        
+        # point must be of the same dimensions of the tree to be searchable
+        if len(point) != len(root.pivot): return None
+        if k < 1: return []
+        
+        point = _queryKey(self.__typecode, point)
+        
+        # the distances are kept with the root they were found for, since the tree
+        # may have been changed (and its distances dropped) while they were found
+        cached = self.__kRadii.get(k)
+        if not cached or cached[0] is not root:
+            cached = (root, self.__nearestRadii(root, k))
+            self.__kRadii[k] = cached
+        radii = cached[1]
         
-        csv = open(filename)
         ans = []
+        stack = [root]
+        
+        while stack:
+            
+            b = stack.pop()
+            own, greatest = radii[b]
+            curDist = _squareDist(point, b.pivot)
+            
+            # none of Ball b's points reach as far as the point
+            if BallTree.__minSqDist(point, b, curDist) > greatest: continue
+            
+            if curDist != 0 and curDist <= own: ans += [tuple(b.pivot)]
+            if b.leftChild: stack.append(b.leftChild)
+            if b.rightChild: stack.append(b.rightChild)
+        
+        ans.sort()
+        
+        return ans
+    
+    # the square distance from each point to its k-th nearest neighbor (infinite if 
+    # it has fewer than k), with the largest such distance under each Ball
+    def __nearestRadii(self, root, k):
+        
+        radii = {}
+        
+        for b in reversed(BallTree.__balls(root)):
+            
+            nearest = self.__knn(root, b.pivot, k)
+            own = nearest[-1][0] if len(nearest) == k else math.inf
+            
+            greatest = max([own] + [radii[child][1] for child in (b.leftChild, b.rightChild) if child])
+            radii[b] = (own, greatest)
+        
+        return radii
+            
+        
+    # returns a list of nodes within a certain radius from a point
+    # The points can be filtered on their data like nearestNeighbors' 
+    # If a deadline or maxNodes is given, returns the points found before it ran out
+    # and whether that's all of them, like nearestNeighbors
+    def countRadius(self, point, radius, dataRange=None, predicate=None, deadline=None, maxNodes=None):
+        
+        root = self.__root
+        
+        # must be a valid point and radius
+        if len(point) != len(root.pivot) or radius <= 0: return None
+        if dataRange and dataRange[0] > dataRange[1]: return None
+        
+        point = _queryKey(self.__typecode, point)
+        
+        budget = BallTree.__budget(deadline, maxNodes)
+        withinRadius = [tuple(key) for key in 
+                        self.__inRadius(point, radius**2, root, [], dataRange, predicate, budget)]
+        
+        # sort so the answer can be compared with the Fake BallTree
+        withinRadius.sort()
+        
+        if budget is None: return withinRadius
+        return withinRadius, not budget[2]
+    
+    
+    # recursive searches for the neighbors within sqRad of point
+    def __inRadius(self, point, sqRad, b, ans, dataRange=None, predicate=None, budget=None):
+        
+        # none of Ball b's points can have data in the range
+        if not BallTree.__mayPass(b, dataRange): return ans
+        if budget and not BallTree.__spend(budget): return ans
+        
+        curDist = _squareDist(point, b.pivot)
+        
+        # none of Ball b's points can be within the radius
+        if BallTree.__minSqDist(point, b, curDist) >= sqRad: return ans
+        
+        # if it's not the same point and the distance is within the sqRad, append 
+        if point != b.pivot and curDist < sqRad and BallTree.__passes(b.data, dataRange, predicate): 
+            ans += [b.pivot]
+            
+        # call on children
+        if b.leftChild: ans = self.__inRadius(point, sqRad, b.leftChild, ans, dataRange, predicate, budget)
+        if b.rightChild: ans = self.__inRadius(point, sqRad, b.rightChild, ans, dataRange, predicate, budget)
+        
+        return ans            
+    
+    # the budget of a query given a deadline (in seconds from now) and a most Balls
+    # to visit, either of which may be None, or None if there's neither. It's the 
+    # Balls left to visit, the time to stop by, and whether the query ran out
+    def __budget(deadline, maxNodes):
+        
+        if deadline is None and maxNodes is None: return None
+        
+        return [math.inf if maxNodes is None else maxNodes, 
+                math.inf if deadline is None else time.monotonic() + deadline, False]
+    
+    # spends a visit to a Ball from a query's budget, or returns False (and marks 
+    # that the query ran out) if there's none left
+    def __spend(budget):
+        
+        if budget[0] <= 0 or time.monotonic() >= budget[1]:
+            budget[2] = True
+            return False
+        
+        budget[0] -= 1
+        return True
+    
+    # ways to aggregate the data of points
+    __aggregates = ("sum", "mean", "min", "max")
+    
+    # returns the sum, mean, lowest, or highest data of the points within radius 
+    # distance to the point (the same points countRadius returns), or None if there
+    # are no such points (0 for a sum) or the data can't be aggregated that way
+    # Balls entirely within the radius are aggregated at once from their payloads
+    def aggregateRadius(self, point, radius, op="sum"):
+        
+        # the path to the point has to be in the same version of the tree as the 
+        # Balls that are aggregated
+        root = self.__root
+        
+        # must be a valid point, radius, and aggregate
+        if len(point) != len(root.pivot) or radius <= 0: return None
+        if op not in BallTree.__aggregates: return None
+        
+        point = _queryKey(self.__typecode, point)
+        
+        # the point isn't within a radius of itself, so the Balls it's in can't
+        # be aggregated whole without leaving it out
+        path, own = BallTree.__findPath(root, point)
+        
+        # amount of points, total, lowest, and highest data so far
+        ans = [0, 0, None, None]
+        try: self.__aggregate(point, radius**2, op, root, path, own, ans)
+        except TypeError: return None
+        
+        count, total, lo, hi = ans
+        if op == "sum": return total
+        if count == 0: return None
+        if op == "mean": return total / count
+        
+        return lo if op == "min" else hi
+    
+    # returns the set of Balls on the way down from the root to the point and the 
+    # Ball whose pivot is the point, or an empty set and None if the point isn't in
+    # the tree
+    def __findPath(root, point):
+        
+        path = set()
+        b = root
+        
+        while b:
+            
+            path.add(b)
+            if point == b.pivot: return path, b
+            if b.dim == -1: break
+            
+            if BallTree.__goesLeft(b, point): b = b.leftChild
+            else: b = b.rightChild
+        
+        return set(), None
+    
+    # recursively aggregates the data of Ball b's points within sqRad of point, 
+    # where own is the Ball holding the point itself (on the path, if there is one)
+    def __aggregate(self, point, sqRad, op, b, path, own, ans):
+        
+        curDist = _squareDist(point, b.pivot)
+        
+        # none of Ball b's points can be within the radius
+        if BallTree.__minSqDist(point, b, curDist) >= sqRad: return
+        
+        # all of them are, so take them all at once, leaving out the point itself
+        # if it's one of them (which can only be done for a sum or a mean)
+        adds = op in ("sum", "mean")
+        payload = BallTree.__payload(b)
+        whole = payload is not None and (not adds or payload[2] is not None)
+        
+        if whole and BallTree.__maxSqDist(point, b, curDist) < sqRad:
+            if b not in path:
+                BallTree.__addPayload(ans, b.count, payload, adds)
+                return
+            if adds:
+                BallTree.__addPayload(ans, b.count, payload, adds)
+                BallTree.__addPayload(ans, -1, (None, None, -own.data), adds)
+                return
+        
+        if point != b.pivot and curDist < sqRad: 
+            BallTree.__addPayload(ans, 1, (b.data, b.data, b.data), adds)
+        
+        if b.leftChild: self.__aggregate(point, sqRad, op, b.leftChild, path, own, ans)
+        if b.rightChild: self.__aggregate(point, sqRad, op, b.rightChild, path, own, ans)
+    
+    # adds the payload of some amount of points into an aggregate, either into the 
+    # total (if adds) or into the lowest and highest
+    def __addPayload(ans, count, payload, adds):
+        
+        ans[0] += count
+        if adds: ans[1] += payload[2]
+        else:
+            ans[2] = payload[0] if ans[2] is None else min(ans[2], payload[0])
+            ans[3] = payload[1] if ans[3] is None else max(ans[3], payload[1])
+    
+    # returns a list of the points inside the axis-aligned box with corners lo and hi
+    def queryBox(self, lo, hi):
+        
+        root = self.__root
+        
+        # must be a valid box
+        if len(lo) != len(root.pivot) or len(hi) != len(root.pivot): return None
+        
+        inBox = [tuple(key) for key in self.__inBox(lo, hi, root, [])]
+        
+        # sort so the answer can be compared with the Fake BallTree
+        inBox.sort()
+        
+        return inBox
+    
+    # recursively searches for the points in Ball b that are inside the box
+    def __inBox(self, lo, hi, b, ans):
+        
+        # square distance from the pivot to the box, and whether the Ball sticks out of it
+        gap = 0
+        rad = math.sqrt(b.square_rad) * (1 + _rounding)
+        inside = True
+        
+        for i in range(len(lo)):
+            if b.pivot[i] < lo[i]: gap += (lo[i] - b.pivot[i])**2
+            elif b.pivot[i] > hi[i]: gap += (b.pivot[i] - hi[i])**2
+            if b.pivot[i] - rad < lo[i] or b.pivot[i] + rad > hi[i]: inside = False
+        
+        # the box misses the whole Ball
+        if _lowerBound(gap, b.square_rad) > 0: return ans
+        
+        # the whole Ball is in the box
+        if inside: return self.__collect(b, ans)
+        
+        if gap == 0: ans += [b.pivot]
+        
+        # children on the far side of the split dimension can't reach the box
+        # (children split along a direction are only pruned by their Balls)
+        if b.leftChild and (b.dim < 0 or lo[b.dim] < b.pivot[b.dim]): 
+            ans = self.__inBox(lo, hi, b.leftChild, ans)
+        if b.rightChild and (b.dim < 0 or hi[b.dim] >= b.pivot[b.dim]): 
+            ans = self.__inBox(lo, hi, b.rightChild, ans)
+        
+        return ans
+    
+    # adds every point in Ball b to the answer
+    def __collect(self, b, ans):
+        
+        ans += [b.pivot]
+        if b.leftChild: ans = self.__collect(b.leftChild, ans)
+        if b.rightChild: ans = self.__collect(b.rightChild, ans)
+        
+        return ans
+           
+    # kernels for density estimation, as a function of the square distance over 
+    # the square bandwidth; each one only ever shrinks as the distance grows
+    __kernels = {
+        "gaussian": lambda u: math.exp(-0.5 * u),
+        "tophat": lambda u: 1 if u < 1 else 0,
+        "epanechnikov": lambda u: 1 - u if u < 1 else 0,
+    }
+    
+    # returns a list of the kernel density estimates at each of the points
+    # Whole Balls are approximated at once when the least and greatest distances 
+    # to them put the kernel within the tolerance, so each estimate is within 
+    # atol + rtol * (exact estimate); with no tolerance the estimates are exact
+    def kernelDensity(self, points, bandwidth, kernel="gaussian", atol=0, rtol=0):
+        
+        # must be valid points, bandwidth, kernel, and tolerances
+        if kernel not in BallTree.__kernels or bandwidth <= 0: return None
+        if atol < 0 or rtol < 0: return None
+        
+        # the amount of points and the Balls summed over are of the same version
+        root = self.__root
+        size = root.count
+        
+        for point in points:
+            if len(point) != len(root.pivot): return None
+        
+        # scale that makes the kernel integrate to 1 over the space
+        dims = len(root.pivot)
+        if kernel == "gaussian": norm = (2 * math.pi) ** (-dims / 2) 
+        else:
+            # volume of the unit ball
+            norm = math.gamma(dims / 2 + 1) / math.pi ** (dims / 2) 
+            if kernel == "epanechnikov": norm *= (dims + 2) / 2
+        norm /= bandwidth ** dims * size
+        
+        # error allowed on each point's kernel value by the absolute tolerance 
+        tol = atol / (norm * size)
+        
+        estimates = []
+        for point in points:
+            
+            point = _queryKey(self.__typecode, point)
+            
+            curDist = _squareDist(point, root.pivot)
+            total = self.__kde(point, bandwidth**2, BallTree.__kernels[kernel], 
+                               tol, rtol, root, curDist)
+            estimates += [norm * total]
+            
+        return estimates
+    
+    # recursively sums the kernel over every point in Ball b
+    def __kde(self, point, sqBand, kernel, tol, rtol, b, curDist):
+        
+        # the pivot's own contribution
+        total = kernel(curDist / sqBand)
+        
+        for child in (b.leftChild, b.rightChild):
+            if child:
+                
+                # the kernel over the child's points is somewhere between these 
+                childDist = _squareDist(point, child.pivot)
+                high = kernel(_lowerBound(childDist, child.square_rad) / sqBand)
+                low = kernel(_upperBound(childDist, child.square_rad) / sqBand)
+                
+                # approximate the whole child with the middle of that range if it's 
+                # narrow enough, otherwise sum over its points
+                if high - low <= 2 * (tol + rtol * low):
+                    total += child.count * (high + low) / 2
+                else: 
+                    total += self.__kde(point, sqBand, kernel, tol, rtol, child, childDist)
+                    
+        return total
+           
+    # returns a list of how many pairs of a query point and a point in the tree are 
+    # within each of the radii, which must be in increasing order. A pair is within
+    # a radius when its distance is at most the radius, and pairs at distance 0 
+    # count too (unlike countRadius, which leaves out the point and the radius)
+    # The points can be a list of keys or another Ball Tree (even this one, to count
+    # the pairs among its own points, each point paired with itself included). Both
+    # trees are walked together, and whenever the bounds on the distances between 
+    # two Balls settle a range of the radii, all of their pairs are counted at once
+    def twoPointCorrelation(self, points, radii):
+        
+        # the radii must be in order 
+        if any(radii[i] > radii[i + 1] for i in range(len(radii) - 1)): return None
+        
+        # diff[i] holds how many more pairs are within radii[i] than radii[i - 1]
+        sqRadii = [radius**2 if radius >= 0 else -1 for radius in radii]
+        diff = [0] * (len(radii) + 1)
+        root = self.__root
+        
+        if isinstance(points, BallTree): 
+            
+            # must be valid points
+            other = points.__root
+            if len(other.pivot) != len(root.pivot): return None
+            self.__pairs(BallTree.__whole(other), BallTree.__whole(root), 
+                         sqRadii, 0, len(radii), diff)
+        
+        else:
+            
+            # must be valid points
+            for point in points:
+                if len(point) != len(root.pivot): return None
+            
+            # a tree can't hold repeated keys, so the query points are put in a tree 
+            # of their own for each number of times they repeat, and their pairs 
+            # are counted that many times
+            repeats = {}
+            for point in points: repeats[tuple(point)] = repeats.get(tuple(point), 0) + 1
+            
+            for times in set(repeats.values()):
+                
+                keys = [(point, None) for point in repeats if repeats[point] == times]
+                query = BallTree(keys, self.__dtype)
+                if query.getSize() == 0: return None
+                
+                counts = [0] * (len(radii) + 1)
+                self.__pairs(BallTree.__whole(query.__root), BallTree.__whole(root), 
+                             sqRadii, 0, len(radii), counts)
+                diff = [diff[i] + times * counts[i] for i in range(len(diff))]
+        
+        # add up the differences into the counts
+        counts = []
+        total = 0
+        for i in range(len(radii)):
+            total += diff[i]
+            counts += [total]
+            
+        return counts
+    
+    # recursively counts the pairs between parts a and b of the trees for the radii
+    # from lo up to (not including) hi, whose pairs haven't been counted yet
+    # A part is (pivot, square radius, amount of points, Ball or None for just the pivot)
+    def __pairs(self, a, b, sqRadii, lo, hi, diff):
+        
+        # every distance between the parts is within the Balls' radii of this one
+        curDist = _squareDist(a[0], b[0])
+        sqRad = (math.sqrt(a[1]) + math.sqrt(b[1]))**2
+        
+        # if both parts are single points, the distance is exact
+        if sqRad == 0: least = most = curDist
+        else: 
+            least = _lowerBound(curDist, sqRad)
+            most = _upperBound(curDist, sqRad)
+        
+        # the radii too small for any pair don't count anything, and the radii 
+        # big enough for every pair count them all
+        lo = bisect.bisect_left(sqRadii, least, lo, hi)
+        mid = bisect.bisect_left(sqRadii, most, lo, hi)
+        diff[mid] += a[2] * b[2]
+        diff[hi] -= a[2] * b[2]
+        if lo == mid: return
+        
+        # otherwise split the bigger part up and count its parts separately
+        if a[1] >= b[1]:
+            for part in BallTree.__split(a): self.__pairs(part, b, sqRadii, lo, mid, diff)
+        else:
+            for part in BallTree.__split(b): self.__pairs(a, part, sqRadii, lo, mid, diff)
+    
+    # the part made up of all of a Ball's points
+    def __whole(b): return (b.pivot, b.square_rad, b.count, b)
+    
+    # splits a part made up of a Ball into its pivot and its children
+    def __split(part):
+        
+        b = part[3]
+        parts = [(b.pivot, 0, 1, None)]
+        if b.leftChild: parts += [BallTree.__whole(b.leftChild)]
+        if b.rightChild: parts += [BallTree.__whole(b.rightChild)]
+        
+        return parts
+    
+    # Clusters the points with DBSCAN: a point with at least minSamples points within 
+    # eps of it (itself included) is a core point, core points within eps of each 
+    # other are in the same cluster, and every other point joins the cluster of a 
+    # core point within eps of it, if there is one. Returns a dictionary of each 
+    # key's cluster, numbered from 0, with -1 for the points in no cluster (noise)
+    # Rather than searching around each point, the tree is walked against itself 
+    # once, like twoPointCorrelation, to find the pairs of parts of it that are 
+    # entirely within eps of each other; the points are then counted, joined, and 
+    # labelled a whole part at a time
+    def dbscan(self, eps, minSamples=5):
+        
+        # must be a valid distance and amount
+        if eps <= 0 or minSamples < 1: return None
+        
+        # every Ball, each one before the Balls under it; a point is its Ball
+        root = self.__root
+        balls = BallTree.__balls(root)
+        pairs = BallTree.__pairsWithin(root, eps**2)
+        
+        # count the points within eps of each point: every point of a part is 
+        # within eps of all the points of the parts it's paired with
+        added = {}
+        for a, b in pairs: 
+            added[a] = added.get(a, 0) + (b[0].count if b[1] else 1)
+            if a != b: added[b] = added.get(b, 0) + (a[0].count if a[1] else 1)
+        
+        core = set(point for point, total in BallTree.__sumDown(balls, added) if total >= minSamples)
+        
+        # a core point of each Ball that has any, each Ball after the Balls under it
+        cores = {}
+        for b in reversed(balls):
+            rep = b if b in core else cores.get(b.leftChild) or cores.get(b.rightChild)
+            if rep: cores[b] = rep
+        
+        # every core point of a part is joined with every core point of the parts
+        # it's paired with; joined holds the Balls all of whose core points have 
+        # already been joined with the one given, so no Ball is gone through twice
+        leaders = {point: point for point in core}
+        joined = {}
+        for a, b in pairs:
+            repA, repB = BallTree.__corePoint(a, core, cores), BallTree.__corePoint(b, core, cores)
+            if repA and repB:
+                BallTree.__joinPart(a, repA, cores, leaders, joined)
+                BallTree.__joinPart(b, repA, cores, leaders, joined)
+        
+        # number the clusters in the order their first points come up
+        labels, numbers = {}, {}
+        for b in balls:
+            if b in core:
+                leader = BallTree.__leader(leaders, b)
+                if leader not in numbers: numbers[leader] = len(numbers)
+                labels[tuple(b.pivot)] = numbers[leader]
+        
+        # and put the rest in the cluster of a core point within eps, if there is one
+        found = {}
+        for a, b in pairs:
+            for a, b in ((a, b), (b, a)):
+                rep = BallTree.__corePoint(b, core, cores)
+                if rep and a not in found: found[a] = rep
+        
+        for point, rep in BallTree.__firstDown(balls, found):
+            if point not in core:
+                labels[tuple(point.pivot)] = numbers[BallTree.__leader(leaders, rep)] if rep else -1
+        
+        return labels
+    
+    # returns a list of the pairs of parts of the tree under root that are entirely
+    # within sqEps of each other (each pair one way round, and each point with itself)
+    # A part is (Ball, True) for all of a Ball's points or (Ball, False) for just 
+    # its pivot
+    def __pairsWithin(root, sqEps):
+        
+        pairs = []
+        whole = (root, True)
+        stack = [(whole, whole)]
+        
+        while stack:
+            
+            a, b = stack.pop()
+            aRad = a[0].square_rad if a[1] else 0
+            bRad = b[0].square_rad if b[1] else 0
+            
+            # a part paired with itself is only split into pairs of its own parts 
+            # one way round
+            if a == b:
+                if _upperBound(0, 4 * aRad) <= sqEps: pairs += [(a, a)]
+                else:
+                    parts = BallTree.__splitPart(a)
+                    for i in range(len(parts)):
+                        for part in parts[i:]: stack.append((parts[i], part))
+                continue
+            
+            curDist = _squareDist(a[0].pivot, b[0].pivot)
+            
+            # if both parts are single points, the distance is exact
+            if aRad == 0 and bRad == 0:
+                if curDist <= sqEps: pairs += [(a, b)]
+                continue
+            
+            sqRad = (math.sqrt(aRad) + math.sqrt(bRad))**2
+            if _lowerBound(curDist, sqRad) > sqEps: continue
+            if _upperBound(curDist, sqRad) <= sqEps:
+                pairs += [(a, b)]
+                continue
+            
+            # otherwise split the bigger part into its pivot and its children
+            if aRad >= bRad:
+                for part in BallTree.__splitPart(a): stack.append((part, b))
+            else:
+                for part in BallTree.__splitPart(b): stack.append((a, part))
+        
+        return pairs
+    
+    # splits a part made up of all of a Ball's points into its pivot and its children
+    def __splitPart(part):
+        
+        b = part[0]
+        
+        return [(b, False)] + [(child, True) for child in (b.leftChild, b.rightChild) if child]
+    
+    # yields each point with the total of the values given for the parts it's in
+    def __sumDown(balls, values):
+        
+        inherited = {balls[0]: 0}
+        
+        for b in balls:
+            total = inherited[b] + values.get((b, True), 0)
+            for child in (b.leftChild, b.rightChild):
+                if child: inherited[child] = total
+            yield b, total + values.get((b, False), 0)
+    
+    # yields each point with the value given for the smallest part it's in that 
+    # has one, or None if none of them do
+    def __firstDown(balls, values):
+        
+        inherited = {balls[0]: None}
+        
+        for b in balls:
+            value = values.get((b, True)) or inherited[b]
+            for child in (b.leftChild, b.rightChild):
+                if child: inherited[child] = value
+            yield b, values.get((b, False)) or value
+    
+    # a core point in the part, or None if it has none
+    def __corePoint(part, core, cores):
+        
+        if part[1]: return cores.get(part[0])
+        
+        return part[0] if part[0] in core else None
+    
+    # joins every core point in the part with the core point
+    def __joinPart(part, point, cores, leaders, joined):
+        
+        if part[1]: BallTree.__joinBall(part[0], point, cores, leaders, joined)
+        else: BallTree.__join(leaders, part[0], point)
+    
+    # joins every core point in Ball b with the core point, and remembers that
+    # they're joined so that no Ball is gone through for this twice
+    def __joinBall(b, point, cores, leaders, joined):
+        
+        stack = [b]
+        
+        while stack:
+            
+            b = stack.pop()
+            if b not in cores: continue
+            
+            # all the Ball's core points are already joined with one of them
+            if b in joined: 
+                BallTree.__join(leaders, joined[b], point)
+                continue
+            
+            if b in leaders: BallTree.__join(leaders, b, point)
+            joined[b] = point
+            if b.leftChild: stack.append(b.leftChild)
+            if b.rightChild: stack.append(b.rightChild)
+    
+    # the point that leads the core point's cluster in the union-find forest
+    def __leader(leaders, point):
+        
+        while leaders[point] != point:
+            
+            # point halfway up the path as it's followed, to keep it short
+            leaders[point] = leaders[leaders[point]]
+            point = leaders[point]
+        
+        return point
+    
+    # puts two core points in the same cluster
+    def __join(leaders, a, b):
+        
+        a, b = BallTree.__leader(leaders, a), BallTree.__leader(leaders, b)
+        if a != b: leaders[a] = b
+           
+    # converts data from a CSV to a list of tuples and data for Ball Tree construction
+    def __fromFile(filename):
+        
+        return list(BallTree.__readFile(filename))
+    
+    # reads the tuples and data from a CSV one line at a time, so files that don't 
+    # fit in memory can be streamed
+    def __readFile(filename):
+        
+        csv = open(filename)
         
         for line in csv:
             
             # get rid of the new line 
             line = line.replace("\n","")
+            if not line: continue
             # split entries into strings
             entrycsv = line.split(',')
             
@@ -312,16 +1756,12 @@ class BallTree(object):
             data = float(entrycsv[0])
             
             # the rest of the entry will become a tuple of points
-            point = tuple()
-            for i in range(1, len(entrycsv)):
-                point += float(entrycsv[i]),
+            point = tuple(float(entrycsv[i]) for i in range(1, len(entrycsv)))
                 
-            # combine the point and the data, append to answer list
-            entry = point, data,
-            ans += [entry]
+            # combine the point and the data
+            yield point, data
         
         csv.close()
-        return ans
     
     # writes ist of tuples and data from Ball Tree to CSV file
     def __toFile(filename, export):
@@ -349,6 +1789,77 @@ class BallTree(object):
         # close file when done
         csv.close()   
     
+    # reads the keys and data from a NumPy file: a .npy holds one array laid out 
+    # like the CSV, the data in the first column and the key in the rest, and a 
+    # .npz holds an array of keys ("keys", n by d) and one of data ("data")
+    # Returns the flat keys, the data, and the dimensions, or None if the file 
+    # doesn't hold them
+    def __readArrays(filename):
+        
+        try:
+            if filename.endswith(".npy"):
+                with open(filename, "rb") as f: table, shape = _readNpy(f)
+                
+                if len(shape) != 2 or shape[1] < 2:
+                    print("A .npy file must hold one row of data and key per point.")
+                    return None
+                
+                width = shape[1]
+                data = table[0::width]
+                keys = type(table)(table.typecode) if isinstance(table, array.array) else []
+                for i in range(shape[0]): keys.extend(table[i * width + 1:(i + 1) * width])
+                
+                return keys, data, width - 1
+            
+            with zipfile.ZipFile(filename) as z:
+                with z.open("keys.npy") as f: keys, shape = _readNpy(f)
+                with z.open("data.npy") as f: data = _readNpy(f)[0]
+                
+        except (KeyError, ValueError, zipfile.BadZipFile) as e:
+            print("Can't read the keys and data from %s: %s" % (filename, e))
+            return None
+        
+        if len(shape) != 2:
+            print("The keys in a .npz file must be an array of n keys by d dimensions.")
+            return None
+        
+        return keys, data, shape[1]
+    
+    # writes the keys and data from the Ball Tree to a .npy file laid out like the 
+    # CSV, or a .npz file with an array of the keys and one of the data. They're 
+    # stored as 64 bit whole numbers if they all are, and as floats otherwise, or 
+    # in the packed keys' own type. Data must be numbers
+    def __toArrays(filename, export, typecode):
+        
+        if not all(type(entry[1]) in (int, float) for entry in export):
+            print("Data must be numbers to be written to a .npy or .npz file.")
+            return
+        
+        dims = len(export[0][0])
+        data = [entry[1] for entry in export]
+        dataCode = "q" if all(type(value) == int for value in data) else "d"
+        
+        if filename.endswith(".npy"):
+            keys = (value for entry in export for value in entry[0])
+            code = "q" if dataCode == "q" and typecode in (None, "i") and \
+                          all(type(value) == int for value in keys) else "d"
+            table = array.array(code)
+            for key, value in export: 
+                table.append(value)
+                table.extend(key)
+            
+            with open(filename, "wb") as f: _writeNpy(f, table, (len(export), dims + 1))
+            return
+        
+        keyCode = typecode or ("q" if all(type(value) == int for entry in export 
+                                         for value in entry[0]) else "d")
+        keys = array.array(keyCode)
+        for entry in export: keys.extend(entry[0])
+        
+        with zipfile.ZipFile(filename, "w") as z:
+            with z.open("keys.npy", "w", force_zip64=True) as f: _writeNpy(f, keys, (len(export), dims))
+            with z.open("data.npy", "w", force_zip64=True) as f: _writeNpy(f, array.array(dataCode, data), (len(export),))
+    
     # Displays the Ball Tree and its attributes in a table 
     def display(self):
         
@@ -359,82 +1870,1247 @@ class BallTree(object):
         
         
     # converts data from a CSV to a list of tuples and data for Ball Tree construction
+    # A filename ending in .npy or .npz writes NumPy arrays instead (see __toArrays)
     def export(self, filename=None):
         
         # if no file name is provided, will write a new file name under
         if not filename: filename = "BallTree.csv"
         toList = self.__toList(self.__root, [])  
         export = [entry[0:2] for entry in toList]
-        BallTree.__toFile(filename, export)
+        
+        if filename.endswith(".npy") or filename.endswith(".npz"): 
+            BallTree.__toArrays(filename, export, self.__typecode)
+        else: BallTree.__toFile(filename, export)
     
         
-    # converts data from a CSV to a list of tuples and data for Ball Tree construction
-    def __toList(self, b, ans):
+    # orders the Balls can be laid out flat in
+    __orders = ("dfs", "bfs", "veb")
         
-        if not b.leftChild and not b.rightChild:
-            ans += [(b.pivot, b.data, b.square_rad, b.dim)]
-            return ans
+    # writes the Ball Tree to a flat file that a MappedBallTree can memory-map
+    # Data must be numbers, since it's stored as float64
+    # The Balls (and their keys) are laid out in the given order: "dfs" puts every
+    # subtree in one run, "bfs" puts the top levels together (a page of them) with 
+    # each subtree below them in one run, and "veb" (van Emde Boas) lays the tree 
+    # out recursively so a search stays within a few runs at every scale
+    # If quantize is True, the file keeps every key as 8 bit codes instead (see 
+    # _quantStep), a quarter the size of float32 keys, and the keys themselves go 
+    # to a side file (filename + ".keys") that the mapped tree checks its closest
+    # candidates against, so it finds the same points
+    def save(self, filename, order="dfs", quantize=False):
         
-        ans += [(b.pivot, b.data, b.square_rad, b.dim)]
+        flat = self.__flatten(order, quantize)
+        if not flat: return
+        header, offsets, total, columns = flat
         
-        if b.leftChild: ans = self.__toList(b.leftChild, ans)
-        if b.rightChild: ans = self.__toList(b.rightChild, ans)
+        if quantize:
+            with open(filename + ".keys", "wb") as side: columns.pop("exact").tofile(side)
         
-        return ans    
+        out = open(filename, "wb")
+        out.truncate(total)
+        out.write(header)
+        BallTree.__writeColumns(out, offsets, columns, 0, len(self.__root.pivot))
+        out.close()
+    
+    # Publishes the Ball Tree, laid out flat, into a new block of shared memory 
+    # that other processes can attach to by name with MappedBallTree.attach and 
+    # query without copying it. Returns the block, which the publisher has to keep 
+    # and unlink() once no process needs the tree anymore. The Balls are laid out
+    # in the given order, like save's
+    def share(self, name=None, order="dfs"):
         
+        flat = self.__flatten(order)
+        if not flat: return None
+        header, offsets, total, columns = flat
         
-    # multi-dimensional distance formula
-    def __squareDist(start, end):
+        block = shared_memory.SharedMemory(name, create=True, size=total)
+        block.buf[:len(header)] = header
+        for column in columns:
+            start = offsets[column]
+            block.buf[start:start + len(columns[column]) * columns[column].itemsize] = columns[column].tobytes()
+            
+        return block
     
-        dist = 0
+    # lays the whole tree out flat, returning the header, where each column goes,
+    # how long it all is, and the columns, or None if the data isn't numbers
+    # Quantized, the keys column holds the codes, and the keys are kept as "exact"
+    def __flatten(self, order, quantize=False):
         
-        # calculate the square distance based on the amount of dimensions
-        for i in range(len(start)):
-            dist += ((start[i] - end[i]) ** 2)
-    
-        return dist
-
-
-# Utility Methods:
-
-# Creates random multi-dimentional int keys and float data 
-# Input: int for dimension size, int for amount of data entrys, boolean floats for
-#        data type, minimum data value, maximum data value
-# Output: a list of tuples of random d-dimensional keys and amt float data points in at most amt keys
-def generatePoints(d, amt, floats=False, minVal=0, maxVal=1000):
+        if order not in BallTree.__orders:
+            print("order must be one of dfs, bfs, or veb.")
+            return None
+        
+        # the Balls and the amount of them are of the same version of the tree
+        root = self.__root
+        size = root.count
+        typecode = self.__typecode or "d"
+        dims = len(root.pivot)
+        
+        try: columns = BallTree.__flatColumns(root, 0, typecode, order)
+        except TypeError:
+            print("Data must be numbers to be laid out flat.")
+            return None
+        
+        # a quantized file's typecode is the codes' followed by the keys'
+        if quantize:
+            columns["exact"] = columns["keys"]
+            columns["keys"] = BallTree.__quantize(columns, dims)
+            typecode = "b" + typecode
+        
+        header = _flatHeader.pack(_flatMagic, dims, size, size, 0, typecode.encode())
+        offsets, total = _flatLayout(dims, size, typecode[0])
+        
+        return header, offsets, total, columns
     
-    # dictionary of tuples as keys, random data as values
-    data = []
+    # codes the keys of a tree laid out flat (with its root first) for a quantized 
+    # file, working down from the root the same way the mapped tree decodes them
+    def __quantize(columns, dims):
+        
+        keys, codes = columns["keys"], array.array("b", bytes(len(columns["keys"])))
+        root = tuple(float(v) for v in keys[:dims])
+        slack = _quantSlack(root, columns["square_rad"][0])
+        stack = [(0, root, 0)]
+        
+        while stack:
+            
+            i, decoded, half = stack.pop()
+            step = _quantStep(columns["square_rad"][i], half, slack)
+            
+            for child in (columns["left"][i], columns["right"][i]):
+                if child == -1: continue
+                
+                start = child * dims
+                code = array.array("b", [max(-127, min(127, round((keys[start + j] - decoded[j]) / step))) 
+                                         if step else 0 for j in range(dims)])
+                codes[start:start + dims] = code
+                stack.append((child, _dequantize(decoded, code, step), step / 2))
+        
+        return codes
     
-    # for the amount of data requested (accounting for keys with duplicate amounts of data)
-    while len(data) < amt:
+    # Builds a Ball Tree file from a CSV that is too big to fit in memory, and 
+    # returns it as a MappedBallTree
+    # The CSV is read twice. The first pass counts and samples the points, and the
+    # upper levels of the tree are split on the sample. The second pass sends each 
+    # point down those levels into one of the partitions below them, which are 
+    # spilled to temporary files. Each partition, about maxPoints points, is then 
+    # built in memory on its own and written into its place in the file, laid out
+    # in the given order (the upper levels stay depth-first). A partition the 
+    # sample missed the size of by too much is split again the same way first, so
+    # no more than about maxPoints points are ever held in memory at once
+    def buildOutOfCore(source, filename, maxPoints=100000, dtype="float64", sampleSize=10000, order="dfs"):
+        
+        if dtype not in BallTree.__typecodes:
+            print("dtype must be one of float32, float64, or int32.")
+            return None
+        if order not in BallTree.__orders:
+            print("order must be one of dfs, bfs, or veb.")
+            return None
+        if maxPoints < 1 or sampleSize < 2:
+            print("maxPoints must be at least 1, and sampleSize at least 2.")
+            return None
+        typecode = BallTree.__typecodes[dtype]
+        
+        def packed():
+            for point in BallTree.__readFile(source): yield _packKey(typecode, point[0]), point[1]
         
-        # create a tuple to contain each data entry
-        coordinate = generateKey(d, floats, minVal, maxVal)
+        # first pass: count the points and keep a random sample of them
+        sample, n = BallTree.__sampleOf(packed(), sampleSize)
+        
+        if n == 0:
+            print("Must have at least one point.")
+            return None
+        if any(point[0] is None for point in sample):
+            print("Keys must be whole numbers that fit in 32 bits to be stored as int32.")
+            return None
+        dims = len(sample[0][0])
+        
+        # split the upper levels on the sample, as Balls whose children are partition
+        # numbers until the partitions are built
+        made = [0]
+        upper = BallTree.__planSplits([Ball(key, data, 0, -1) for key, data in sample], 
+                                      math.ceil(n / maxPoints), made)
+        
+        with tempfile.TemporaryDirectory() as spill:
+            
+            # second pass: spill each point to the partition it ends up in
+            if not BallTree.__spillPoints(packed(), upper, spill, dims, maxPoints):
+                print("Keys must all be the same length and fit the dtype.")
+                return None
             
-        # create the tuple of the point and data
-        entry = coordinate, random.random(),
+            # build each partition in turn, laying the whole tree out depth-first
+            offsets, total = _flatLayout(dims, n, typecode)
+            out = open(filename, "w+b")
+            out.truncate(total)
+            plan = (maxPoints, sampleSize, made)
+            size = BallTree.__placeOutOfCore(upper, out, offsets, [0], spill, dims, dtype, order, plan)[1]
+            out.seek(0)
+            out.write(_flatHeader.pack(_flatMagic, dims, size, n, 0, typecode.encode()))
+            out.close()
+        
+        return MappedBallTree(filename)
+    
+    # returns a random sample of sampleSize of the points, and how many points 
+    # there are
+    def __sampleOf(points, sampleSize):
+        
+        sample = []
+        n = 0
+        for point in points:
+            n += 1
+            if len(sample) < sampleSize: sample += [point]
+            else:
+                i = random.randrange(n)
+                if i < sampleSize: sample[i] = point
+        
+        return sample, n
+    
+    # recursively splits the sample into the given amount of parts the same way 
+    # construction splits points; made holds the amount of partitions made so far
+    def __planSplits(sample, parts, made):
+        
+        # this side of the split is a partition of its own
+        if parts <= 1 or len(sample) < 2:
+            made[0] += 1
+            return made[0] - 1
+        
+        maxDim = BallTree.__dimGreatestSpread(sample)
+        b = BallTree.__pivotPoint(sample, maxDim)
+        pivot = b.pivot
+        
+        l = [point for point in sample if point.pivot != pivot and point.pivot[maxDim] < pivot[maxDim]]
+        r = [point for point in sample if point.pivot != pivot and point.pivot[maxDim] >= pivot[maxDim]]
+        
+        # the pivot isn't the median, so each side gets the share of the parts its
+        # share of the sample needs
+        leftParts = round(parts * len(l) / max(1, len(l) + len(r)))
+        leftParts = max(1, min(parts - 1, leftParts))
+        
+        b.dim = maxDim
+        b.leftChild = BallTree.__planSplits(l, leftParts, made)
+        b.rightChild = BallTree.__planSplits(r, parts - leftParts, made)
+        
+        return b
+    
+    # sends each point down the upper levels, growing their radii to fit it, and 
+    # spills it to the file of the partition it ends up in. The rows are held back
+    # and appended batch points at a time, so only one file is ever open. Returns 
+    # False if a key doesn't fit the tree
+    def __spillPoints(points, upper, spill, dims, batch):
+        
+        rows = {}
+        held = 0
+        
+        for key, data in points:
+            
+            if key is None or len(key) != dims: return False
+            
+            b = upper
+            while isinstance(b, Ball):
+                
+                # the point is the pivot of an upper level Ball
+                if key == b.pivot: break
+                
+                b.square_rad = max(b.square_rad, _squareDist(key, b.pivot))
+                if key[b.dim] < b.pivot[b.dim]: b = b.leftChild
+                else: b = b.rightChild
+                
+            else:
+                rows.setdefault(b, bytearray()).extend(key.tobytes() + struct.pack("d", data))
+                held += 1
+                if held >= batch:
+                    BallTree.__appendSpill(rows, spill)
+                    held = 0
+        
+        BallTree.__appendSpill(rows, spill)
+        return True
+    
+    # appends the rows held back for each partition to its file
+    def __appendSpill(rows, spill):
+        
+        for part in rows:
+            with open(os.path.join(spill, str(part)), "ab") as f: f.write(rows[part])
+        rows.clear()
+    
+    # reads back the points spilled to a partition's file, a block at a time
+    def __readSpill(path, dims, typecode):
+        
+        width = dims * array.array(typecode).itemsize
+        
+        with open(path, "rb") as f:
+            while True:
+                
+                raw = f.read((width + 8) * 4096)
+                if not raw: return
+                
+                for start in range(0, len(raw), width + 8):
+                    key = array.array(typecode)
+                    key.frombytes(raw[start:start + width])
+                    yield key, struct.unpack_from("d", raw, start + width)[0]
+    
+    # recursively writes the upper level Ball or partition b into the file at the 
+    # next free index, returning the index it went to (-1 if it's empty) and how 
+    # many points it holds. plan is (maxPoints, sampleSize, partitions made)
+    def __placeOutOfCore(b, out, offsets, free, spill, dims, dtype, order, plan):
+        
+        typecode = BallTree.__typecodes[dtype]
+        maxPoints, sampleSize, made = plan
+        
+        if isinstance(b, Ball):
+            
+            # the pivot goes first, then its children
+            index = free[0]
+            free[0] += 1
+            left, leftCount = BallTree.__placeOutOfCore(b.leftChild, out, offsets, free, spill, dims, 
+                                                        dtype, order, plan)
+            right, rightCount = BallTree.__placeOutOfCore(b.rightChild, out, offsets, free, spill, dims, 
+                                                          dtype, order, plan)
+            b.count = 1 + leftCount + rightCount
+            
+            columns = BallTree.__emptyColumns(typecode)
+            BallTree.__flatRow(columns, b, left, right)
+            BallTree.__writeColumns(out, offsets, columns, index, dims)
+            
+            return index, b.count
+        
+        # no point was spilled to the partition
+        path = os.path.join(spill, str(b))
+        if not os.path.exists(path): return -1, 0
+        count = os.path.getsize(path) // (dims * array.array(typecode).itemsize + 8)
+        
+        # the partition is too big to build in memory, so it's split into upper 
+        # levels and partitions of its own (which always have fewer points, since 
+        # the upper levels' pivots are some of its points)
+        if count > maxPoints:
+            
+            sample = BallTree.__sampleOf(BallTree.__readSpill(path, dims, typecode), sampleSize)[0]
+            upper = BallTree.__planSplits([Ball(key, data, 0, -1) for key, data in sample], 
+                                          math.ceil(count / maxPoints), made)
+            BallTree.__spillPoints(BallTree.__readSpill(path, dims, typecode), upper, spill, dims, maxPoints)
+            os.remove(path)
+            
+            return BallTree.__placeOutOfCore(upper, out, offsets, free, spill, dims, dtype, order, plan)
+        
+        # read the partition's points back in and build it
+        tree = BallTree(list(BallTree.__readSpill(path, dims, typecode)), dtype)
+        index = free[0]
+        free[0] += tree.__size
+        BallTree.__writeColumns(out, offsets, BallTree.__flatColumns(tree.__root, index, typecode, order), 
+                                index, dims)
+        
+        return index, tree.__size
+    
+    # a flat file's columns, empty
+    def __emptyColumns(typecode):
+        
+        columns = {name: array.array(code) for name, code in _flatColumns}
+        columns["keys"] = array.array(typecode)
+        
+        return columns
+    
+    # flattens the Balls under b into columns in the given order, numbering them 
+    # from first
+    def __flatColumns(b, first, typecode, order="dfs"):
+        
+        columns = BallTree.__emptyColumns(typecode)
+        balls = BallTree.__ordered(b, order)
+        index = {ball: first + i for i, ball in enumerate(balls)}
+        
+        for b in balls:
+            left = index[b.leftChild] if b.leftChild else -1
+            right = index[b.rightChild] if b.rightChild else -1
+            BallTree.__flatRow(columns, b, left, right)
+            
+        return columns
+    
+    # returns a list of the Balls under b in the order they're laid out flat in
+    def __ordered(b, order):
+        
+        balls = []
+        
+        if order == "veb":
+            
+            # the van Emde Boas layout is defined on the height of the tree
+            height, level = 0, [b]
+            while level:
+                height += 1
+                level = [child for ball in level for child in (ball.leftChild, ball.rightChild) if child]
+            
+            BallTree.__vanEmdeBoas(b, height, balls)
+            return balls
+        
+        stack = [b]
+        if order == "bfs":
+            
+            # whole levels, as long as they fit in a page of each column (the 
+            # keys aside), and then the subtrees below them from left to right
+            level = [b]
+            while level and len(balls) + len(level) <= mmap.PAGESIZE // 8:
+                balls += level
+                level = [child for ball in level for child in (ball.leftChild, ball.rightChild) if child]
+            stack = level[::-1]
+        
+        # depth-first: a Ball's left child comes right after it and its right 
+        # child right after the left child's Balls
+        while stack:
+            b = stack.pop()
+            balls += [b]
+            if b.rightChild: stack.append(b.rightChild)
+            if b.leftChild: stack.append(b.leftChild)
+        
+        return balls
+    
+    # adds the top height levels of the tree under b to the list in van Emde Boas
+    # order: the top half of the levels first, laid out the same way, and then each 
+    # of the subtrees hanging off them, from left to right
+    def __vanEmdeBoas(b, height, balls):
+        
+        if height == 1:
+            balls += [b]
+            return
+        
+        top = height // 2
+        BallTree.__vanEmdeBoas(b, top, balls)
+        
+        level = [b]
+        for i in range(top):
+            level = [child for ball in level for child in (ball.leftChild, ball.rightChild) if child]
+        for child in level: BallTree.__vanEmdeBoas(child, height - top, balls)
+    
+    # adds Ball b, whose children are at the indices left and right, to the columns
+    def __flatRow(columns, b, left, right):
+        
+        columns["left"].append(left)
+        columns["right"].append(right)
+        columns["square_rad"].append(b.square_rad)
+        columns["dim"].append(b.dim)
+        columns["count"].append(b.count)
+        columns["data"].append(b.data)
+        columns["keys"].extend(b.pivot)
+    
+    # writes columns of Balls into the file at the given index
+    def __writeColumns(out, offsets, columns, index, dims):
+        
+        for name in columns:
+            width = columns[name].itemsize * (dims if name == "keys" else 1)
+            out.seek(offsets[name] + index * width)
+            columns[name].tofile(out)
+    
+    # converts data from a CSV to a list of tuples and data for Ball Tree construction
+    def __toList(self, b, ans):
+        
+        if not b.leftChild and not b.rightChild:
+            ans += [(tuple(b.pivot), b.data, b.square_rad, b.dim)]
+            return ans
+        
+        ans += [(tuple(b.pivot), b.data, b.square_rad, b.dim)]
+        
+        if b.leftChild: ans = self.__toList(b.leftChild, ans)
+        if b.rightChild: ans = self.__toList(b.rightChild, ans)
+        
+        return ans    
+        
+        
+
+
+# Class that splits points across several Ball Trees (shards), each of which may 
+# live in its own worker process, and answers queries across all of them
+class ShardedBallTree(object):
+    
+    # Sharded Ball Tree accessors
+    def getSize(self): return sum(self.__sizes)              # amount of points in all shards
+    def getShardCount(self): return len(self.__sizes)        # amount of shards
+    
+    # Splits the points into the given amount of shards, either spatially (cutting
+    # the dimension of greatest spread at the median, like the top of a Ball Tree) 
+    # or by hashing the keys, and builds a Ball Tree on each. With processes=True 
+    # each shard is built and queried in its own worker process
+    def __init__(self, points, shards=4, partition="spatial", processes=False, dtype=None):
+        
+        self.__sizes = []
+        self.__shards = []
+        self.__processes = processes
+        
+        if partition not in ("spatial", "hash"):
+            print("Partition must be spatial or hash.")
+            return
+        if shards < 1 or len(points) == 0: 
+            print("Must have at least one shard and one point.")
+            return
+        
+        self.__dims = len(points[0][0])
+        
+        if partition == "spatial": groups = ShardedBallTree.__partition(points, shards)
+        else:
+            groups = [[] for i in range(shards)]
+            for point in points: groups[hash(tuple(point[0])) % shards] += [point]
+        
+        # a shard with no points isn't worth keeping
+        groups = [group for group in groups if len(group) > 0]
+        
+        # each shard is bounded by a ball around the centroid of its points, so 
+        # whole shards can be skipped just like Balls inside a tree
+        self.__bounds = [ShardedBallTree.__bound(group) for group in groups]
+        
+        for group in groups:
+            if processes:
+                conn, child = multiprocessing.Pipe()
+                worker = multiprocessing.Process(target=_serveShard, args=(child, group, dtype), 
+                                                 daemon=True)
+                worker.start()
+                self.__shards += [(conn, worker)]
+            else: 
+                self.__shards += [BallTree(group, dtype)]
+        
+        # the workers report their sizes once their trees are built
+        if processes: self.__sizes = [conn.recv() for conn, worker in self.__shards]
+        else: self.__sizes = [tree.getSize() for tree in self.__shards]
+    
+    # stops the worker processes, if there are any
+    def close(self):
+        
+        if self.__processes:
+            for conn, worker in self.__shards:
+                conn.send(None)
+                worker.join()
+                conn.close()
+        self.__shards = []
+    
+    # returns the data at the queried point
+    def find(self, key):
+        
+        if len(key) != self.__dims: return None
+        
+        # only shards whose bounds hold the point can have it
+        for bound, i in self.__order(key):
+            if bound > 0: break
+            data = self.__query([i], "find", (key,))[0]
+            if data is not None: return data
+        
+        return None
+    
+    # returns a list of the k nearest points to the point, closest first
+    def nearestNeighbors(self, point, k=1):
+        
+        # point must be of the same dimensions of the shards to be searchable
+        if len(point) != self.__dims: return None
+        if k < 1: return [] # need to search for at least 1 neighbor
+        
+        # search the closest shard first, then every other shard that could 
+        # still hold something closer than its k-th neighbor
+        order = self.__order(point)
+        found = self.__query([order[0][1]], "nearestNeighbors", (point, k))[0]
+        
+        kth = math.inf
+        if len(found) == k: kth = _squareDist(point, found[-1])
+        
+        rest = [i for bound, i in order[1:] if bound <= kth]
+        for neighbors in self.__query(rest, "nearestNeighbors", (point, k)): found += neighbors
+        
+        # merge the shards' neighbors, breaking ties by key like a single tree
+        found.sort(key=lambda key: (_squareDist(point, key), key))
+        
+        return found[:k]
+    
+    # returns a list of the points that are within radius distance to the point
+    def countRadius(self, point, radius):
+        
+        # must be a valid point and radius
+        if len(point) != self.__dims or radius <= 0: return None
+        
+        # only shards that reach within the radius can hold anything
+        shards = [i for bound, i in self.__order(point) if bound < radius**2]
+        
+        withinRadius = []
+        for found in self.__query(shards, "countRadius", (point, radius)): withinRadius += found
+        
+        # sort so the answer can be compared with a single Ball Tree
+        withinRadius.sort()
+        
+        return withinRadius
+    
+    # returns a list of the least square distance from the point to anything in 
+    # each shard with the shard's index, in order of that distance
+    def __order(self, point):
+        
+        order = []
+        for i in range(len(self.__bounds)):
+            
+            center, sqRad = self.__bounds[i]
+            
+            order += [(_lowerBound(_squareDist(point, center), sqRad), i)]
+        
+        order.sort()
+        
+        return order
+    
+    # runs a Ball Tree method on each of the shards and returns their answers
+    # The worker processes are all sent their queries before any answer is 
+    # waited on, so the shards search at the same time
+    def __query(self, shards, method, args):
+        
+        if not self.__processes:
+            return [getattr(self.__shards[i], method)(*args) for i in shards]
+        
+        for i in shards: self.__shards[i][0].send((method, args))
+        
+        return [self.__shards[i][0].recv() for i in shards]
+        
+    # splits points into n groups by cutting the dimension of greatest spread at
+    # the median until there are enough groups
+    def __partition(points, n):
+        
+        if n == 1 or len(points) < 2: return [points]
+        
+        # find the dimension of greatest spread 
+        dims = len(points[0][0])
+        spreads = [max(point[0][i] for point in points) - min(point[0][i] for point in points) 
+                   for i in range(dims)]
+        dim = spreads.index(max(spreads))
+        
+        # cut so each half has its share of the groups' points
+        points = sorted(points, key=lambda point: point[0][dim])
+        cut = len(points) * (n // 2) // n
+        
+        return (ShardedBallTree.__partition(points[:cut], n // 2) + 
+                ShardedBallTree.__partition(points[cut:], n - n // 2))
+    
+    # returns the centroid of the points and the square distance to the farthest one
+    def __bound(points):
+        
+        dims = len(points[0][0])
+        center = tuple(sum(point[0][i] for point in points) / len(points) for i in range(dims))
+        sqRad = max(_squareDist(point[0], center) for point in points)
+        
+        return (center, sqRad)
+
+
+# Builds a Ball Tree for one shard in a worker process, then runs the queries that
+# come through the connection on it until it's sent None
+def _serveShard(conn, points, dtype):
+    
+    tree = BallTree(points, dtype)
+    conn.send(tree.getSize())
+    
+    while True:
+        
+        query = conn.recv()
+        if query is None: break
+        
+        method, args = query
+        conn.send(getattr(tree, method)(*args))
+    
+    conn.close()
+
+
+# Class that answers queries on a Ball Tree laid out flat in a file (or any other 
+# buffer), memory-mapped rather than read in, so the tree can be bigger than memory
+# and is shared by every process that maps the same file. It can't be changed
+class MappedBallTree(object):
+    
+    # Mapped Ball Tree accessors
+    def getSize(self): return self.__size                             # amount of points
+    def getRadius(self): return math.sqrt(self.__sqRad[self.__root])  # radius of root
+    def getDtype(self): return self.__dtype                           # storage type of the keys
+    
+    # Maps a file written by BallTree.save or BallTree.buildOutOfCore, and for a
+    # quantized file, its side file of keys
+    def __init__(self, filename):
+        
+        self.__size = 0
+        self.__views = []
+        self.__block = self.__sideFile = None
+        
+        self.__file, self.__map = open(filename, "rb"), None
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__attach(memoryview(self.__map))
+        
+        # an empty file can't be mapped at all
+        except ValueError:
+            if self.__map: self.__map.close()
+            self.__file.close()
+            raise ValueError("Not a Ball Tree file.") from None
+        
+        if self.__quantized:
+            self.__sideFile = open(filename + ".keys", "rb")
+            self.__sideMap = mmap.mmap(self.__sideFile.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self.__sideMap)
+            self.__exact = view.cast(self.__typecode)
+            self.__views = [self.__exact, view] + self.__views
+    
+    # Attaches, read-only, to a tree published with BallTree.share
+    def attach(name):
+        
+        tree = MappedBallTree.__new__(MappedBallTree)
+        tree.__size = 0
+        tree.__views = []
+        tree.__file = tree.__map = tree.__sideFile = None
+        
+        # the block belongs to the publisher, so it mustn't be cleaned up when 
+        # this process exits. Before Python 3.13 every block opened is tracked; 
+        # that's harmless in processes forked or spawned from the publisher, which 
+        # share its tracker, but a tracker of this process's own would unlink it
+        try: tree.__block = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            shared = resource_tracker._resource_tracker._fd is not None
+            tree.__block = shared_memory.SharedMemory(name)
+            if not shared: resource_tracker.unregister(tree.__block._name, "shared_memory")
+        
+        try: tree.__attach(tree.__block.buf.toreadonly())
+        except ValueError:
+            tree.__block.close()
+            raise
+        
+        return tree
+        
+    # reads the header and points the columns at their places in the buffer, or 
+    # raises a ValueError if the buffer doesn't hold a Ball Tree
+    def __attach(self, buf):
+        
+        if len(buf) < _flatHeader.size or _flatHeader.unpack_from(buf, 0)[0] != _flatMagic:
+            buf.release()
+            raise ValueError("Not a Ball Tree file.")
+        magic, dims, size, capacity, root, typecode = _flatHeader.unpack_from(buf, 0)
+        
+        self.__dims, self.__size, self.__root = dims, size, root
+        
+        # a quantized file's keys column holds the 8 bit codes, and the keys are 
+        # in the side file (mapped once the file is)
+        codes = typecode.rstrip(b"\0").decode()
+        self.__typecode = codes[-1]
+        self.__quantized, self.__exact = len(codes) == 2, None
+        self.__dtype = {"f": "float32", "d": "float64", "i": "int32"}[self.__typecode]
+        
+        # each column is cast in place, without copying
+        offsets, total = _flatLayout(dims, capacity, codes[0])
+        columns = {}
+        for name, code in _flatColumns + [("keys", codes[0])]:
+            length = capacity * (dims if name == "keys" else 1)
+            view = buf[offsets[name]:offsets[name] + length * array.array(code).itemsize]
+            columns[name] = view.cast(code)
+            self.__views += [view, columns[name]]
+        self.__views += [buf]
+        
+        self.__left, self.__right = columns["left"], columns["right"]
+        self.__sqRad, self.__dim = columns["square_rad"], columns["dim"]
+        self.__data, self.__keys = columns["data"], columns["keys"]
+    
+    # unmaps the file (or detaches from the shared memory); the tree can't be 
+    # queried after
+    def close(self):
+        
+        for view in self.__views: view.release()
+        self.__views = []
+        
+        if self.__block: self.__block.close()
+        else:
+            self.__map.close()
+            self.__file.close()
+        
+        if self.__sideFile:
+            self.__sideMap.close()
+            self.__sideFile.close()
+    
+    # returns the data at the queried point
+    def find(self, key):
+        
+        if len(key) != self.__dims: return None
+        
+        # compare with the stored keys in their own precision
+        key = _packKey(self.__typecode, key)
+        if key is None: return None
+        
+        # follow the splits down, like BallTree's find; the directions of splits 
+        # along a direction aren't stored, so below them every child whose Ball 
+        # holds the key is searched. A quantized tree's keys are read from its side
+        # file along the way
+        keys = self.__exact if self.__quantized else self.__keys
+        stack = [self.__root]
+        while stack:
+            
+            i = stack.pop()
+            start = i * self.__dims
+            if all(key[j] == keys[start + j] for j in range(self.__dims)): 
+                return self.__data[i]
+            
+            dim = self.__dim[i]
+            if dim >= 0:
+                child = self.__left[i] if key[dim] < keys[start + dim] else self.__right[i]
+                if child != -1: stack.append(child)
+            elif dim == -2:
+                for child in (self.__left[i], self.__right[i]):
+                    if child != -1 and self.__squareDist(key, child, keys) <= self.__sqRad[child]: 
+                        stack.append(child)
+        
+        return None
+    
+    # returns a list of the k nearest points to the point, closest first, with the 
+    # same best-first search as BallTree
+    def nearestNeighbors(self, point, k=1):
+        
+        # point must be of the same dimensions of the tree to be searchable
+        if len(point) != self.__dims: return None
+        if k < 1: return [] # need to search for at least 1 neighbor
+        
+        point = _queryKey(self.__typecode, point)
+        
+        if self.__quantized: return self.__nearestQuantized(point, k)
+        
+        ans = []
+        q = [(0, 0, 0, self.__root, self.__squareDist(point, self.__root))]
+        
+        while q and len(ans) < k:
+            
+            dist, isPoint, key, i, curDist = heapq.heappop(q)
+            
+            # no Ball left in the queue can hold a closer point than this one
+            if isPoint: 
+                ans += [key]
+                continue
+            
+            # a point cannot be its own nearest neighbor 
+            if curDist != 0: heapq.heappush(q, (curDist, 1, self.__key(i), i, None))
+            
+            # queue the children by how close their points could possibly be
+            for child in (self.__left[i], self.__right[i]):
+                if child != -1:
+                    childDist = self.__squareDist(point, child)
+                    bound = _lowerBound(childDist, self.__sqRad[child])
+                    heapq.heappush(q, (bound, 0, child, child, childDist))
+        
+        return ans
+    
+    # returns a list of the points that are within radius distance to the point
+    def countRadius(self, point, radius):
+        
+        # must be a valid point and radius
+        if len(point) != self.__dims or radius <= 0: return None
+        
+        point = _queryKey(self.__typecode, point)
+        
+        sqRad = radius**2
+        if self.__quantized: return self.__inRadiusQuantized(point, sqRad)
+        
+        withinRadius = []
+        stack = [self.__root]
+        
+        while stack:
+            
+            i = stack.pop()
+            
+            # a point isn't within a radius of itself
+            curDist = self.__squareDist(point, i)
+            if 0 < curDist < sqRad: withinRadius += [self.__key(i)]
+            
+            # skip children that are entirely outside the radius
+            for child in (self.__left[i], self.__right[i]):
+                if child != -1:
+                    bound = _lowerBound(self.__squareDist(point, child), self.__sqRad[child])
+                    if bound < sqRad: stack.append(child)
+        
+        # sort so the answer can be compared with BallTree
+        withinRadius.sort()
+        
+        return withinRadius
+    
+    # the same best-first search for a quantized tree. Balls are queued by how close
+    # their points could be given their decoded keys, and each Ball's own point is
+    # a candidate until its key is read from the side file, when it's queued again
+    # at its actual distance. So only the keys of the closest candidates are read
+    # Queue entries are (distance, 0 for a Ball, 1 for a candidate, or 2 for a 
+    # point, tie breaker, index, decoded key, how far off it can be per dimension)
+    def __nearestQuantized(self, point, k):
+        
+        ans = []
+        root, slack = self.__decodeRoot()
+        q = [(0, 0, self.__root, self.__root, root, 0)]
+        
+        while q and len(ans) < k:
+            
+            dist, kind, key, i, decoded, half = heapq.heappop(q)
+            
+            if kind == 2: 
+                ans += [key]
+                continue
+            
+            # a point cannot be its own nearest neighbor 
+            if kind == 1:
+                curDist = self.__squareDist(point, i, self.__exact)
+                if curDist != 0: heapq.heappush(q, (curDist, 2, self.__key(i, self.__exact), i, None, None))
+                continue
+            
+            sqDist = _squareDist(point, decoded)
+            bound = self.__lowerBoundQuantized(sqDist, half + slack, 0)
+            heapq.heappush(q, (bound, 1, i, i, None, None))
+            
+            for child, childKey, childHalf in self.__children(i, decoded, half, slack):
+                sqDist = _squareDist(point, childKey)
+                bound = self.__lowerBoundQuantized(sqDist, childHalf + slack, self.__sqRad[child])
+                heapq.heappush(q, (bound, 0, child, child, childKey, childHalf))
+        
+        return ans
+    
+    # the points of a quantized tree within sqRad of the point, checking the keys 
+    # of the Balls whose decoded keys are close enough against the side file
+    def __inRadiusQuantized(self, point, sqRad):
+        
+        withinRadius = []
+        root, slack = self.__decodeRoot()
+        stack = [(self.__root, root, 0)]
+        
+        while stack:
+            
+            i, decoded, half = stack.pop()
+            
+            sqDist = _squareDist(point, decoded)
+            if self.__lowerBoundQuantized(sqDist, half + slack, 0) < sqRad:
+                curDist = self.__squareDist(point, i, self.__exact)
+                if 0 < curDist < sqRad: withinRadius += [self.__key(i, self.__exact)]
+            
+            for child, childKey, childHalf in self.__children(i, decoded, half, slack):
+                sqDist = _squareDist(point, childKey)
+                if self.__lowerBoundQuantized(sqDist, childHalf + slack, self.__sqRad[child]) < sqRad:
+                    stack.append((child, childKey, childHalf))
+        
+        withinRadius.sort()
+        
+        return withinRadius
+    
+    # a quantized tree's root key, which is decoded straight from the side file, 
+    # and the rounding its keys allow for
+    def __decodeRoot(self):
+        
+        root = tuple(float(v) for v in self.__key(self.__root, self.__exact))
+        
+        return root, _quantSlack(root, self.__sqRad[self.__root])
+    
+    # the children of the quantized Ball at index i, given its decoded key and how
+    # far off that can be, with their own decoded keys and how far off they can be
+    def __children(self, i, decoded, half, slack):
+        
+        step = _quantStep(self.__sqRad[i], half, slack)
+        
+        for child in (self.__left[i], self.__right[i]):
+            if child != -1:
+                start = child * self.__dims
+                yield child, _dequantize(decoded, self.__keys[start:start + self.__dims], step), step / 2
+    
+    # least square distance from a point to anything inside a quantized Ball, given
+    # the square distance to its decoded key, how far off that can be in each 
+    # dimension, and the Ball's square radius
+    def __lowerBoundQuantized(self, sqDist, off, sqRad):
+        
+        gap = math.sqrt(sqDist) * (1 - _rounding) - off * math.sqrt(self.__dims) * (1 + 1e-9) - math.sqrt(sqRad)
+        
+        return gap * gap if gap > 0 else 0
+    
+    # the key of the Ball at index i (from keys, if given)
+    def __key(self, i, keys=None): 
+        if keys is None: keys = self.__keys
+        return tuple(keys[i * self.__dims:(i + 1) * self.__dims])
+    
+    # square distance between a point and the key of the Ball at index i (from keys,
+    # if given)
+    def __squareDist(self, point, i, keys=None):
+        
+        if keys is None: keys = self.__keys
+        dist = 0
+        start = i * self.__dims
+        
+        for j in range(self.__dims):
+            dist += ((point[j] - keys[start + j]) ** 2)
+            
+        return dist
+
+
+# how far distances are pulled in or pushed out by, relative to their size, so 
+# that floating point rounding can never put a bound past the distance of a point
+# that a Ball actually contains
+_rounding = 1e-12
+
+# multi-dimensional distance formula
+def _squareDist(start, end):
+    
+    dist = 0
+    
+    # calculate the square distance based on the amount of dimensions
+    for i in range(len(start)):
+        dist += ((start[i] - end[i]) ** 2)
+    
+    return dist
+
+# least square distance from a point to anything inside a Ball, given the square
+# distance from the point to the Ball's pivot and the Ball's square radius, pulled
+# in by a hair
+def _lowerBound(sqDist, sqRad):
+    
+    # the point is inside the Ball
+    if sqDist <= sqRad: return 0
+    
+    gap = math.sqrt(sqDist) * (1 - _rounding) - math.sqrt(sqRad)
+    
+    return gap * gap if gap > 0 else 0
+
+# greatest square distance from a point to anything inside a Ball, pushed out by 
+# a hair (the radius too, since its square root may not square back up to it)
+def _upperBound(sqDist, sqRad):
+    
+    gap = (math.sqrt(sqDist) + math.sqrt(sqRad)) * (1 + _rounding)
+    
+    return gap * gap
+
+# A quantized flat file codes each Ball's key from its parent's decoded key: in 
+# each dimension it's the nearest whole number of steps (-127 to 127) from it. The 
+# step is 1/127th of the most a child's key can be from the decoded key in one 
+# dimension: the parent's radius, plus as much as the decoded key can be off by 
+# (half its own step, and slack for rounding), so no code ever has to be clamped
+# The root's key is read from the side file instead
+def _quantStep(sqRad, half, slack): return (math.sqrt(sqRad) + half + slack) * (1 + 1e-9) / 127
+
+# the rounding a quantized tree's decoded keys allow for, which grows with how big
+# its keys are (the root's, plus its radius)
+def _quantSlack(root, sqRad): return (max(abs(v) for v in root) + math.sqrt(sqRad)) * _rounding
+
+# a child's decoded key, from its parent's decoded key, its codes, and their step
+def _dequantize(decoded, codes, step): 
+    return tuple(decoded[j] + codes[j] * step for j in range(len(decoded)))
+
+# a query point in the precision of the stored keys (typecode, if there is one), 
+# or as given if it can't be stored that way
+def _queryKey(typecode, point):
+    
+    key = _packKey(typecode, point) if typecode else None
+    
+    return point if key is None else key
+
+# stores a key packed into an array of the given typecode, or returns None if it 
+# can't be (an int32 key only holds whole numbers that fit in 32 bits)
+def _packKey(typecode, key):
+    
+    try: 
+        # whole numbers may have come in as floats
+        if typecode == "i":
+            if any(v != int(v) for v in key): return None
+            key = [int(v) for v in key]
+            
+        return array.array(typecode, key)
+    
+    except (OverflowError, ValueError): return None
+
+
+# NumPy (.npy) files start with a magic string, a version, and the length of a 
+# header that describes the array as a Python dictionary, padded out so the values
+# start on a multiple of 64 bytes. Their types, by array typecode
+_npyMagic = b"\x93NUMPY"
+_npyTypes = {"b": "i1", "B": "u1", "h": "i2", "H": "u2", "i": "i4", "I": "u4", 
+             "q": "i8", "Q": "u8", "f": "f4", "d": "f8"}
+
+# writes an array's values as a .npy file of the given shape, in little endian
+def _writeNpy(f, values, shape):
+    
+    header = "{'descr': '<%s', 'fortran_order': False, 'shape': %s, }" % \
+             (_npyTypes[values.typecode], str(tuple(shape)))
+    header += " " * (63 - (len(header) + 10) % 64) + "\n"
+    
+    f.write(_npyMagic + b"\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+    
+    if sys.byteorder == "big": 
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    f.write(values.tobytes())
+
+# reads a .npy file into a flat array, row after row, and returns it with its shape
+# Arrays of booleans come back as 0s and 1s. Raises ValueError for anything that 
+# isn't an array of plain numbers
+def _readNpy(f):
+    
+    if f.read(6) != _npyMagic: raise ValueError("not a .npy file")
+    
+    major = f.read(2)[0]
+    size = struct.unpack("<H", f.read(2))[0] if major == 1 else struct.unpack("<I", f.read(4))[0]
+    
+    try: header = ast.literal_eval(f.read(size).decode("latin1"))
+    except (SyntaxError, ValueError): raise ValueError("bad .npy header")
+    
+    descr, shape = header["descr"], tuple(header["shape"])
+    if not isinstance(descr, str): raise ValueError("not an array of plain numbers")
+    
+    codes = {value: key for key, value in _npyTypes.items()}
+    codes["b1"] = "B"
+    if descr[1:] not in codes: raise ValueError("can't read arrays of type %s" % descr)
+    
+    values = array.array(codes[descr[1:]])
+    count = 1
+    for length in shape: count *= length
+    values.frombytes(f.read(count * values.itemsize))
+    if len(values) != count: raise ValueError("the file is cut short")
+    
+    # bytes are swapped if they're in the other order from the machine's
+    if (descr[0] == "<" and sys.byteorder == "big") or (descr[0] == ">" and sys.byteorder == "little"): 
+        values.byteswap()
+    
+    # a 2-D array stored a column at a time is turned around
+    if header.get("fortran_order") and len(shape) == 2:
+        rows, columns = shape
+        values = array.array(values.typecode, 
+                             (values[j * rows + i] for i in range(rows) for j in range(columns)))
+    
+    return values, shape
+
+
+# Flat Ball Tree files start with a header (magic, dimensions, amount of points, 
+# amount of room for points, index of the root, key typecode) and then hold one 
+# column per Ball attribute, each indexed by Ball, followed by the keys. A Ball's 
+# children are the indices of their own Balls (-1 for none). Everything is in the 
+# machine's own byte order
+_flatMagic = b"BALLTREE"
+_flatHeader = struct.Struct("=8sqqqq8s")
+_flatColumns = [("left", "q"), ("right", "q"), ("square_rad", "d"), ("dim", "q"), 
+                ("count", "q"), ("data", "d")]
+
+# returns where each column starts in a flat file and how long the file is
+def _flatLayout(dims, capacity, typecode):
+    
+    offsets = {}
+    offset = 64 # room for the header
+    
+    for name, code in _flatColumns:
+        offsets[name] = offset
+        offset += capacity * array.array(code).itemsize
+        
+    offsets["keys"] = offset
+    offset += capacity * dims * array.array(typecode).itemsize
+    
+    return offsets, offset
+
+# Utility Methods:
+
+# Creates random multi-dimentional int keys and float data 
+# Input: int for dimension size, int for amount of data entrys, boolean floats for
+#        data type, minimum data value, maximum data value
+# Output: a list of tuples of random unique d-dimensional keys and float data, amt of
+#         them unless there aren't that many different int keys in the range
+def generatePoints(d, amt, floats=False, minVal=0, maxVal=1000):
+    
+    keys, data = generateArrays(d, amt, "uniform", floats, minVal, maxVal)
+    
+    # create the tuple of each point and its data
+    return [(tuple(keys[i * d:(i + 1) * d]), data[i]) for i in range(len(data))]
+
+
+# Creates random unique multi-dimentional keys and float data as flat arrays, which 
+# BallTree.fromArrays builds from without any tuples
+# Input: int for dimension size, int for amount of data entrys, str distribution of
+#        the keys, boolean floats for data type, minimum data value, maximum data 
+#        value, seed for the random numbers (or None to use the random module's)
+# Distributions: "uniform" over the range, "clusters" of gaussian points, "skewed"
+#        towards the minimum, "sorted" (uniform, in order), and "lowdim" (points on 
+#        a random plane, so the data has two dimensions whatever d is)
+# Output: an array of the keys one after another ("d" for floats, "q" for ints) and
+#         an array of the float data, amt of them unless there aren't that many 
+#         different int keys in the range (or the distribution keeps repeating them)
+def generateArrays(d, amt, distribution="uniform", floats=False, minVal=0, maxVal=1000, seed=None):
+    
+    rng = random.Random(seed) if seed is not None else random
+    keys = array.array("d" if floats else "q")
+    
+    if not floats: 
+        minVal, maxVal = int(minVal), int(maxVal)
+        amt = min(amt, (maxVal - minVal + 1) ** d)
+        
+    # uniform int keys are sampled without replacement from every key in the range,
+    # each one numbered by its digits in base (size of the range)
+    if distribution == "uniform" and not floats:
+        
+        span = maxVal - minVal + 1
+        
+        # sample can't index a range bigger than a C long, but then a repeated key
+        # is unlikely enough to just draw again
+        if span ** d <= sys.maxsize: codes = rng.sample(range(span ** d), amt)
+        else:
+            codes = set()
+            while len(codes) < amt: codes.add(rng.randrange(span ** d))
+        
+        for code in codes:
+            for i in range(d):
+                code, digit = divmod(code, span)
+                keys.append(minVal + digit)
+                
+    else:
+        
+        # points come from the distribution in [0, 1), are scaled into the range, 
+        # and are only kept the first time they come up
+        points = generateUnit(d, amt, distribution, rng)
+        seen = set()
+        
+        while len(seen) < amt:
+            
+            found = len(seen)
+            for i in range(0, len(points), d):
+                
+                point = tuple(minVal + v * (maxVal - minVal) for v in points[i:i + d])
+                if not floats: point = tuple(round(v) for v in point)
+                
+                if point not in seen and len(seen) < amt:
+                    seen.add(point)
+                    keys.extend(point)
+                    
+            # a distribution that can't come up with any more new int keys in amt
+            # tries is done
+            if len(seen) == found: break
+            points = generateUnit(d, amt, distribution, rng)
+        
+        if distribution == "sorted":
+            points = sorted(tuple(keys[i:i + d]) for i in range(0, len(keys), d))
+            keys = array.array(keys.typecode, [v for point in points for v in point])
+    
+    data = array.array("d", [rng.random() for i in range(len(keys) // d)])
+    
+    return keys, data
+
+
+# randomly generate amt d-dimensional points in [0, 1) from a distribution
+# Input: int d for dimension size, int amt, str distribution, random number generator
+# Output: a list of the points' values, one point after another
+def generateUnit(d, amt, distribution, rng):
+    
+    if distribution in ("uniform", "sorted"):
+        return [rng.random() for i in range(d * amt)]
+    
+    if distribution == "skewed":
+        return [rng.random() ** 4 for i in range(d * amt)]
+    
+    if distribution == "clusters":
+        
+        # eight clusters around random centers, clipped to the range
+        centers = [[rng.random() for i in range(d)] for i in range(8)]
+        values = []
+        for i in range(amt):
+            center = rng.choice(centers)
+            values += [min(max(rng.gauss(v, 0.03), 0), 0.999999) for v in center]
+        return values
+    
+    if distribution == "lowdim":
         
-        # add to dictionary, without duplicates
-        if entry not in data: data += [entry]
+        # each dimension is a random mix of the two coordinates of a point in a 
+        # square, so the points lie on a plane in d dimensions
+        weights = [rng.random() for i in range(d)]
+        values = []
+        for i in range(amt):
+            x, y = rng.random(), rng.random()
+            values += [w * x + (1 - w) * y for w in weights]
+        return values
     
-    return data
+    raise ValueError("Unknown distribution: " + distribution)
 
 
 # randomly generate a multi-dimensional tuple key
 # Input: int d for dimension size, boolean floats for data type, minimum data value, maximum data value
 # Output: a tuple key of random d-dimensional values
 def generateKey(d, floats, minVal=0, maxVal=1000):
-    # create a tuple to contain each data entry
-    coordinate = tuple()
     
     # fill the tuple with random numbers
-    for i in range(d):
-        # concatenate tuples to get a tuple with d items
-        if floats: coordinate += random.uniform(minVal, maxVal),
-        else: coordinate += random.randint(int(minVal), int(maxVal)),
-         
-    return coordinate
+    if floats: return tuple(random.uniform(minVal, maxVal) for i in range(d))
+    return tuple(random.randint(int(minVal), int(maxVal)) for i in range(d))
 
 
 def main():
@@ -2,6 +2,11 @@ import pytest
 import sys
 import math
 import random
+import array
+import threading
+import struct
+import resource
+import multiprocessing
 from BallTree import * 
 
 # fake ball tree class to test the 
@@ -189,6 +194,338 @@ def test_construct_random_torture():
             assert t.find(point[0]) == ft.find(point[0])
 
 
+# Trees whose keys are packed into float32, float64, or int32 arrays hold the same
+# points and find the same data as the default tree
+def test_construct_dtypes():
+    
+    for i in range(10):
+        
+        dim = random.randint(2,10)
+        p = generatePoints(dim, random.randint(10, 500), False, -10000, 10000)
+        ft = FakeBallTree(p)
+        
+        for dtype in ["float32", "float64", "int32"]:
+            
+            t = BallTree(p, dtype)
+            assert t.getDtype() == dtype
+            assert t.getSize() == len(p) and t.getSize() == ft.getSize()
+            
+            for point in p:
+                assert t.find(point[0]) == point[1]
+            
+            # whole-number keys are stored exactly, so queries match the default tree
+            key, data = random.choice(p)
+            n = random.randint(1, len(p))
+            assert t.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+
+# float32 keys are rounded when stored, and queries are rounded the same way
+def test_construct_float32_rounding():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,10)
+        p = generatePoints(dim, random.randint(10, 500), True, -10000, 10000)
+        t = BallTree(p, "float32")
+        
+        for point in p:
+            assert t.find(point[0]) == point[1]
+        
+        # a point in the tree is still not its own nearest neighbor
+        key, data = random.choice(p)
+        assert len(t.nearestNeighbors(key, len(p))) == len(p) - 1
+
+# an int32 tree only holds whole numbers
+def test_construct_int32_floats():
+    
+    p = generatePoints(3, 50, False, -10000, 10000)
+    t = BallTree(p, "int32")
+    
+    # whole-number floats are the same key, fractional ones can't be in the tree
+    key, data = random.choice(p)
+    assert t.find(tuple(float(v) for v in key)) == data
+    assert t.find(tuple(v + 0.5 for v in key)) == None
+    assert len(t.nearestNeighbors(tuple(v + 0.5 for v in key), 1)) == 1
+    
+    # a tree can't be constructed from fractional keys
+    p = [((1.5, 2.0), 0.1), ((3.0, 4.0), 0.2)]
+    assert BallTree(p, "int32").getSize() == 0
+
+# trees built straight from flat arrays of keys hold the same points as trees 
+# built from tuples
+def test_construct_from_arrays():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,10)
+        p = generatePoints(dim, random.randint(10, 500), False, -10000, 10000)
+        ft = FakeBallTree(p)
+        
+        for dtype in [None, "float32", "float64", "int32"]:
+            
+            keys = array.array("i" if dtype == "int32" else "d", [v for key, data in p for v in key])
+            data = array.array("d", [data for key, data in p])
+            t = BallTree.fromArrays(keys, data, dtype)
+            
+            assert t.getSize() == len(p) and t.getSize() == ft.getSize()
+            for point in p: assert t.find(point[0]) == point[1]
+            
+            key, data = random.choice(p)
+            n = random.randint(1, len(p))
+            assert t.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+    
+    # keys and data must line up
+    assert BallTree.fromArrays(array.array("d", [1, 2, 3]), [0.5, 0.5]) == None
+
+# a 2-D buffer of keys (like a NumPy array) builds the same tree as the flat array
+def test_construct_from_buffer():
+    
+    for i in range(5):
+        
+        dim = random.randint(1,6)
+        p = generatePoints(dim, random.randint(10, 300), True, -1000, 1000)
+        keys = array.array("d", [v for key, data in p for v in key])
+        data = array.array("d", [data for key, data in p])
+        
+        for dtype in [None, "float64", "float32"]:
+            
+            grid = memoryview(keys).cast("B").cast("d", (len(p), dim))
+            t = BallTree.fromArrays(grid, memoryview(data), dtype)
+            ft = BallTree.fromArrays(keys, data, dtype)
+            
+            assert t.getSize() == len(p)
+            for point in p: assert t.find(point[0]) == ft.find(point[0])
+            
+            key = generateKey(dim, True, -1000, 1000)
+            assert t.nearestNeighbors(key, 5) == ft.nearestNeighbors(key, 5)
+    
+    # the rows must line up with the data, even when the amounts divide evenly
+    grid = memoryview(array.array("d", range(12))).cast("B").cast("d", (4, 3))
+    assert BallTree.fromArrays(grid, [0.5] * 6) == None
+
+# trees written to .npy and .npz files read back the same, whatever the dtype
+def test_construct_npy_npz(tmp_path):
+    
+    for floats in [True, False]:
+        
+        dim = random.randint(1,6)
+        p = generatePoints(dim, random.randint(10, 300), floats, 0, 1000)
+        
+        for dtype in [None, "float64", "float32", "int32"]:
+            if floats and dtype == "int32": continue
+            
+            t = BallTree(p, dtype)
+            for name in ["tree.npy", "tree.npz"]:
+                
+                t.export(str(tmp_path / name))
+                read = BallTree(str(tmp_path / name), dtype)
+                
+                assert read.getSize() == len(p)
+                for point in p: assert read.find(point[0]) == t.find(point[0])
+    
+    # arrays stored big endian or a column at a time are read right too
+    with open(str(tmp_path / "odd.npy"), "wb") as f:
+        header = "{'descr': '>i4', 'fortran_order': True, 'shape': (2, 3), }"
+        f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode())
+        f.write(struct.pack(">6i", 7, 8, 1, 3, 2, 4))
+    
+    t = BallTree(str(tmp_path / "odd.npy"))
+    assert t.find((1, 2)) == 7 and t.find((3, 4)) == 8
+    
+    # anything but numbers isn't written or read
+    BallTree([((1, 2), "a")]).export(str(tmp_path / "words.npz"))
+    assert not (tmp_path / "words.npz").exists()
+    
+    with open(str(tmp_path / "words.npy"), "wb") as f:
+        header = "{'descr': '<U1', 'fortran_order': False, 'shape': (1, 3), }"
+        f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode())
+        f.write("abc".encode("utf-32-le"))
+    
+    assert BallTree(str(tmp_path / "words.npy")).getSize() == 0
+
+# generated keys are unique, in range, and build straight into a tree
+def test_construct_generated_arrays():
+    
+    for distribution in ["uniform", "clusters", "skewed", "sorted", "lowdim"]:
+        for floats in [True, False]:
+            
+            dim = random.randint(2,6)
+            keys, data = generateArrays(dim, 500, distribution, floats, -1000, 1000)
+            p = [(tuple(keys[i * dim:(i + 1) * dim]), data[i]) for i in range(len(data))]
+            
+            assert len(p) == 500 and len(set(key for key, d in p)) == 500
+            assert all(-1000 <= v <= 1000 for v in keys)
+            assert keys.typecode == ("d" if floats else "q")
+            if distribution == "sorted": assert p == sorted(p)
+            
+            t, ft = BallTree.fromArrays(keys, data), FakeBallTree(p)
+            assert t.getSize() == 500
+            for point in p: assert t.find(point[0]) == point[1]
+            
+            key, d = random.choice(p)
+            n = random.randint(1, len(p))
+            assert t.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+
+def test_construct_generated_seeds():
+    
+    # the same seed gives the same data
+    assert generateArrays(3, 100, "clusters", True, seed=7) == generateArrays(3, 100, "clusters", True, seed=7)
+    assert generateArrays(3, 100, seed=7) != generateArrays(3, 100, seed=8)
+    
+    # there are only 121 different int keys in a small range
+    keys, data = generateArrays(2, 500, "uniform", False, 0, 10)
+    assert len(data) == 121 and len(set(zip(keys[::2], keys[1::2]))) == 121
+    assert len(generatePoints(2, 500, False, 0, 10)) == 121
+    
+    with pytest.raises(ValueError): generateArrays(2, 10, "spiral")
+
+# lazy trees are built as they're searched, and answer the same as built ones
+def test_construct_lazy():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,10)
+        p = generatePoints(dim, random.randint(10, 1000), True, -10000, 10000)
+        ft = FakeBallTree(p)
+        
+        for lazy in [True, 3]:
+            
+            t = BallTree(p, lazy=lazy)
+            assert t.getSize() == len(p)
+            
+            key, data = random.choice(p)
+            n = random.randint(1, len(p))
+            assert t.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+            assert t.countRadius(key, 5000) == BallTree(p).countRadius(key, 5000)
+            for point in p: assert t.find(point[0]) == point[1]
+            
+            # building the rest of it leaves the same tree
+            t.build()
+            assert t.getDepth() == BallTree(p, lazy=lazy).getDepth()
+    
+    # repeated keys are dropped up front
+    assert BallTree([((1, 2), 0.5), ((1, 2), 0.5), ((3, 4), 0.5)], lazy=True).getSize() == 2
+
+def test_construct_lazy_background():
+    
+    dim = random.randint(2,6)
+    keys, data = generateArrays(dim, 2000, "clusters", True)
+    p = [(tuple(keys[i * dim:(i + 1) * dim]), data[i]) for i in range(len(data))]
+    ft = FakeBallTree(p)
+    
+    for dtype in [None, "float32"]:
+        
+        t = BallTree.fromArrays(keys, data, dtype, lazy=True)
+        thread = t.build(background=True)
+        
+        # search while it builds
+        for i in range(20):
+            key, d = random.choice(p)
+            if dtype: assert len(t.nearestNeighbors(key, 5)) == 5
+            else: assert t.nearestNeighbors(key, 5) == ft.nearestNeighbors(key, 5)
+            
+        thread.join()
+        assert t.getSize() == len(p)
+        assert t.getDepth() == BallTree.fromArrays(keys, data, dtype, lazy=True).getDepth()
+        if not dtype:
+            for point in p: assert t.find(point[0]) == point[1]
+
+# tight trees prune with centroid balls and boxes, and answer the same
+def test_construct_tight():
+    
+    for distribution in ["uniform", "clusters", "lowdim"]:
+        
+        dim = random.randint(2,8)
+        keys, data = generateArrays(dim, random.randint(10, 1000), distribution, True, -10000, 10000)
+        p = [(tuple(keys[i * dim:(i + 1) * dim]), data[i]) for i in range(len(data))]
+        ft = FakeBallTree(p)
+        
+        for dtype in [None, "float32"]:
+            
+            t = BallTree(p, dtype)
+            trees = [BallTree(p, dtype, tight=True), BallTree.fromArrays(keys, data, dtype, lazy=True, tight=True)]
+            trees[0].rebuild()
+            
+            for tight in trees:
+                assert tight.getSize() == len(p)
+                for i in range(5):
+                    key, d = random.choice(p)
+                    n = random.randint(1, len(p))
+                    radius = random.uniform(0, 5000)
+                    assert tight.nearestNeighbors(key, n) == t.nearestNeighbors(key, n)
+                    assert tight.countRadius(key, radius) == t.countRadius(key, radius)
+                    if not dtype: assert tight.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+
+# trees split along directions hold the same points and answer the same
+def test_construct_split():
+    
+    for split in ["pca", "random", "farthest"]:
+        
+        dim = random.randint(2,12)
+        keys, data = generateArrays(dim, random.randint(10, 1000), random.choice(["lowdim", "clusters"]), 
+                                    True, -10000, 10000)
+        p = [(tuple(keys[i * dim:(i + 1) * dim]), data[i]) for i in range(len(data))]
+        t = BallTree(p)
+        lo, hi = generateKey(dim, True, -10000, 0), generateKey(dim, True, 0, 10000)
+        
+        trees = [BallTree(p, split=split), BallTree.fromArrays(keys, data, "float64", True, True, split)]
+        trees[0].rebuild()
+        
+        for s in trees:
+            assert s.getSize() == len(p)
+            for point in p: assert s.find(point[0]) == point[1]
+            assert s.queryBox(lo, hi) == t.queryBox(lo, hi)
+            
+            for i in range(5):
+                key, d = random.choice(p)
+                n = random.randint(1, len(p))
+                assert s.nearestNeighbors(key, n) == t.nearestNeighbors(key, n)
+                assert s.countRadius(key, 5000) == t.countRadius(key, 5000)
+                assert math.isclose(s.aggregateRadius(key, 5000), t.aggregateRadius(key, 5000), abs_tol=1e-9)
+    
+    assert BallTree(p, split="kmeans").getSize() == 0
+
+# rebuilding splits at the exact median, which gives the shallowest tree
+def test_rebuild():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,10)
+        p = generatePoints(dim, random.randint(10, 1000), True, -10000, 10000)
+        t, ft = BallTree(p), FakeBallTree(p)
+        
+        t.rebuild()
+        assert t.getDepth() == math.ceil(math.log2(len(p) + 1))
+        assert t.getSize() == len(p)
+        for point in p: assert t.find(point[0]) == point[1]
+        
+        key, data = random.choice(p)
+        n = random.randint(1, len(p))
+        assert t.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+
+# rebalancing only rebuilds the subtrees that are too deep
+def test_rebalance():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,10)
+        p = generatePoints(dim, random.randint(10, 1000), True, -10000, 10000)
+        t, ft = BallTree(p), FakeBallTree(p)
+        depth = t.getDepth()
+        
+        # nothing is far enough off to be rebuilt
+        t.rebalance(depth)
+        assert t.getDepth() == depth
+        
+        # everything is
+        t.rebalance(1)
+        assert t.getDepth() == math.ceil(math.log2(len(p) + 1))
+        assert t.getSize() == len(p)
+        for point in p: assert t.find(point[0]) == point[1]
+        
+        key, data = random.choice(p)
+        n = random.randint(1, len(p))
+        assert t.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+
 ############ BALL TREE FIND ################################################
 
 # Note: Because the tests above verified that find() works for points that are 
@@ -568,6 +905,160 @@ def test_nss_torture():
             assert len(t_ans) == size - 1    
         assert t_ans == ft_ans
         
+# query points that aren't in the tree get their n nearest neighbors, closest first
+def test_nns_query_not_in_tree():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,10)
+        dType = random.choice([True, False])
+        p = generatePoints(dim, random.randint(10, 1000), dType, -10000, 10000) 
+        
+        t, ft = BallTree(p), FakeBallTree(p)
+        
+        for i in range(5):
+            key = generateKey(dim, dType, -10000, 10000)
+            n = random.randint(1, len(p))
+            
+            t_ans = t.nearestNeighbors(key, n)
+            assert t_ans == ft.nearestNeighbors(key, n)
+            
+            # neighbors come back in order of distance
+            dists = [sum((key[j] - nb[j])**2 for j in range(dim)) for nb in t_ans]
+            assert dists == sorted(dists)
+
+# densely packed int points have many ties in distance, which are broken by key
+def test_nns_ties():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,4)
+        p = generatePoints(dim, random.randint(50, 200), False, 0, 10) 
+        
+        t, ft = BallTree(p), FakeBallTree(p)
+        
+        for i in range(5):
+            key = generateKey(dim, False, 0, 10)
+            n = random.randint(1, len(p))
+            assert t.nearestNeighbors(key, n) == ft.nearestNeighbors(key, n)
+
+# neighbors filtered on their data are the nearest of the points that pass
+def test_nns_filtered():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,6)
+        p = generatePoints(dim, random.randint(50, 500), True, -10000, 10000)
+        data = dict(p)
+        t, ft = BallTree(p, tight=random.choice([True, False])), FakeBallTree(p)
+        
+        for i in range(5):
+            key = random.choice([random.choice(p)[0], generateKey(dim, True, -10000, 10000)])
+            n = random.randint(1, len(p))
+            lo = random.random()
+            hi = lo + random.random() / 4
+            
+            near = ft.nearestNeighbors(key, len(p))
+            assert t.nearestNeighbors(key, n, (lo, hi)) == [k for k in near if lo <= data[k] <= hi][:n]
+            assert t.nearestNeighbors(key, n, predicate=lambda d: d > hi) == [k for k in near if data[k] > hi][:n]
+            assert t.nearestNeighbors(key, n, (lo, 1), lambda d: d > hi) == [k for k in near if data[k] > hi][:n]
+    
+    # the range must be in order
+    assert t.nearestNeighbors(key, 1, (1, 0)) == None
+        
+# with a budget, the answer is exact if it says so, and otherwise a list of real 
+# points, closest first, that the search found before it ran out
+def test_nns_budget():
+    
+    for i in range(10):
+        
+        dim = random.randint(1,5)
+        p = generatePoints(dim, random.randint(1, 400), True, 0, 100)
+        t = BallTree(p, tight=random.choice([True, False]))
+        dist = lambda key: sum((a - b)**2 for a, b in zip(point, key))
+        
+        point = generateKey(dim, True, 0, 100)
+        k = random.randint(1, 20)
+        near = t.nearestNeighbors(point, k)
+        
+        assert t.nearestNeighbors(point, k, maxNodes=len(p)) == (near, True)
+        assert t.nearestNeighbors(point, k, deadline=60) == (near, True)
+        
+        for maxNodes in [0, 1, 5, 20]:
+            found, exact = t.nearestNeighbors(point, k, maxNodes=maxNodes)
+            if exact: assert found == near
+            else: 
+                assert len(found) <= k and set(found) <= set(dict(p))
+                assert [dist(key) for key in found] == sorted(dist(key) for key in found)
+    
+    # out of time before the search starts
+    assert t.nearestNeighbors(point, k, deadline=0) == ([], False)
+    assert t.nearestNeighbors(point, 0, maxNodes=0) == ([], True)
+
+############ FARTHEST AND REVERSE NEIGHBORS ################################
+
+# square distance between two keys
+def bruteDist(a, b): return sum((a[i] - b[i])**2 for i in range(len(a)))
+
+# the points sorted farthest first, ties by key, leaving out the point itself
+def bruteFarthest(keys, point):
+    
+    return sorted((key for key in keys if key != point), key=lambda key: (-bruteDist(point, key), key))
+
+# the points that are no farther from the point than from their own k-th 
+# nearest neighbor
+def bruteReverse(keys, point, k):
+    
+    ans = []
+    
+    for key in keys:
+        if key == point: continue
+        others = sorted(bruteDist(key, other) for other in keys if other != key)
+        if len(others) < k or bruteDist(key, point) <= others[k - 1]: ans += [key]
+    
+    return sorted(ans)
+
+# farthest neighbors come out farthest first, like brute force, for points in
+# the tree and not
+def test_farthest():
+    
+    for i in range(10):
+        
+        dim = random.randint(1, 5)
+        p = list(dict(generatePoints(dim, random.randint(1, 300), random.choice([True, False]), 0, 30)).items())
+        t = BallTree(p, tight=random.choice([True, False]))
+        keys = [key for key, data in p]
+        
+        for i in range(5):
+            key = random.choice([random.choice(keys), generateKey(dim, True, 0, 30)])
+            k = random.randint(1, len(p) + 1)
+            assert t.farthestNeighbors(key, k) == bruteFarthest(keys, key)[:k]
+    
+    assert t.farthestNeighbors(key, 0) == []
+    assert t.farthestNeighbors(key[:-1] + (1, 1)) == None
+
+# reverse nearest neighbors match brute force, including ties (int keys), and 
+# stay right after the tree is rebuilt
+def test_reverse():
+    
+    for i in range(10):
+        
+        dim = random.randint(1, 4)
+        p = list(dict(generatePoints(dim, random.randint(1, 150), random.choice([True, False]), 0, 20)).items())
+        t = BallTree(p, tight=random.choice([True, False]))
+        keys = [key for key, data in p]
+        
+        for i in range(5):
+            key = random.choice([random.choice(keys), generateKey(dim, True, 0, 20)])
+            k = random.randint(1, 6)
+            assert t.reverseNearestNeighbors(key, k) == bruteReverse(keys, key, k)
+            
+        t.rebuild()
+        assert t.reverseNearestNeighbors(key, k) == bruteReverse(keys, key, k)
+    
+    assert t.reverseNearestNeighbors(key, 0) == []
+    assert t.reverseNearestNeighbors(key + (1,)) == None
+        
 ############ WITHIN RADIUS #################################################
 
 # if the radius is 0 or less, return None
@@ -691,7 +1182,88 @@ def test_small_radius_small_tree():
             # small radius (bigger because tree is more spare)
             radius = random.randint(500, 800)
             assert t.countRadius(key, radius) == f.countRadius(key, radius) 
+
+# points within the radius filtered on their data match a brute force search
+def test_radius_filtered():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,6)
+        p = generatePoints(dim, random.randint(50, 500), True, -10000, 10000)
+        t = BallTree(p, lazy=random.choice([True, False]))
+        
+        for i in range(5):
+            key = random.choice([random.choice(p)[0], generateKey(dim, True, -10000, 10000)])
+            radius = random.randint(1000, 10000)
+            lo = random.random()
+            hi = lo + random.random() / 4
+            
+            inside = [k for k, d in p if k != key and sum((a - b)**2 for a, b in zip(k, key)) < radius**2 and lo <= d <= hi]
+            assert t.countRadius(key, radius, (lo, hi)) == sorted(inside)
+            assert t.countRadius(key, radius, predicate=lambda d: lo <= d <= hi) == sorted(inside)
+    
+    # the range must be in order
+    assert t.countRadius(key, 10, (1, 0)) == None
     
+    # data that can't be compared with the range is never within it
+    p = [((1, 2), None), ((3, 4), .5), ((5, 6), "a"), ((7, 8), .7), ((9, 10), (1,))]
+    t = BallTree(p)
+    assert t.nearestNeighbors((0, 0), 2, (0, 1)) == [(3, 4), (7, 8)]
+    assert t.countRadius((0, 0), 100, (0, .6)) == [(3, 4)]
+    assert t.countRadius((0, 0), 100, predicate=lambda d: d is None) == [(1, 2)]
+
+# aggregates of the data within the radius match the data of countRadius' points
+def test_radius_aggregate():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,6)
+        p = generatePoints(dim, random.randint(50, 1000), True, -10000, 10000)
+        data = dict(p)
+        t = BallTree(p, tight=random.choice([True, False]))
+        
+        for i in range(5):
+            key = random.choice([random.choice(p)[0], generateKey(dim, True, -10000, 10000)])
+            radius = random.randint(1000, 20000)
+            inside = [data[k] for k in t.countRadius(key, radius)]
+            
+            assert math.isclose(t.aggregateRadius(key, radius), sum(inside), abs_tol=1e-9)
+            if inside:
+                assert math.isclose(t.aggregateRadius(key, radius, "mean"), sum(inside) / len(inside))
+                assert t.aggregateRadius(key, radius, "min") == min(inside)
+                assert t.aggregateRadius(key, radius, "max") == max(inside)
+            else: assert t.aggregateRadius(key, radius, "mean") == None
+    
+    assert t.aggregateRadius(key, 10, "median") == None
+    assert t.aggregateRadius(key, -10) == None
+    
+    # data that can be compared but not added up
+    t = BallTree([((1, 2), "a"), ((2, 2), "b"), ((3, 3), "c")])
+    assert t.aggregateRadius((1, 2), 5, "max") == "c"
+    assert t.aggregateRadius((1, 2), 5) == None
+    
+# with a budget, the points found are all within the radius, and all of them if
+# the answer says it's exact
+def test_radius_budget():
+    
+    for i in range(10):
+        
+        dim = random.randint(1,5)
+        p = generatePoints(dim, random.randint(1, 400), True, 0, 100)
+        t = BallTree(p, tight=random.choice([True, False]))
+        
+        point, radius = generateKey(dim, True, 0, 100), random.uniform(5, 50)
+        within = t.countRadius(point, radius)
+        
+        assert t.countRadius(point, radius, maxNodes=len(p)) == (within, True)
+        assert t.countRadius(point, radius, deadline=60) == (within, True)
+        
+        for maxNodes in [0, 1, 5, 20]:
+            found, exact = t.countRadius(point, radius, maxNodes=maxNodes)
+            assert found == within if exact else set(found) <= set(within)
+    
+    assert t.countRadius(point, radius, deadline=0) == ([], False)
+
 # randomly choose any of these tests
 def test_radius_torture(): pass
 
@@ -706,5 +1278,620 @@ for i in range(20):
     else: test_bad_radius()
 
 
+############ UPDATES AND SNAPSHOTS #########################################
+
+# random batches of inserts (some replacing data) and deletes (some of keys that
+# aren't there) leave the tree holding exactly what a dictionary would
+def test_update():
+    
+    for i in range(10):
+        
+        dim = random.randint(1,4)
+        floats = random.choice([True, False])
+        p = dict(generatePoints(dim, random.randint(1, 200), floats, 0, 50))
+        t = BallTree(list(p.items()), "float64" if random.random() < .5 else None, 
+                     lazy=random.choice([False, 2]), tight=random.choice([True, False]))
+        
+        for j in range(5):
+            
+            deletes = random.sample(list(p), len(p) // 3) + [generateKey(dim, floats, 0, 50)]
+            inserts = [(generateKey(dim, floats, 0, 50), random.random()) for k in range(random.randint(0, 40))]
+            inserts += [(key, -1) for key in random.sample(list(p), min(3, len(p)))]
+            
+            t.update(inserts, deletes)
+            for key in deletes: p.pop(key, None)
+            p.update(inserts)
+            
+            assert t.getSize() == len(p) and t.getVersion() == j + 1
+            for key in p: assert t.find(key) == p[key]
+            for key in deletes: 
+                if key not in p: assert t.find(key) == None
+            
+            point, radius = generateKey(dim, True, 0, 50), random.uniform(2, 20)
+            n = random.randint(1, len(p))
+            assert t.nearestNeighbors(point, n) == FakeBallTree(list(p.items())).nearestNeighbors(point, n)
+            assert t.countRadius(point, radius) == sorted(key for key in p if 0 < bruteDist(point, key) < radius**2)
+        
+        t.rebuild()
+        for key in p: assert t.find(key) == p[key]
+
+# a snapshot keeps the tree as it was, can't be changed itself, and changes to 
+# it don't reach the tree
+def test_update_snapshot():
+    
+    p = dict(generatePoints(3, 300, True, 0, 100))
+    t = BallTree(list(p.items()))
+    snapshot = t.snapshot()
+    
+    deletes = random.sample(list(p), 100)
+    t.update([((200, 200, 200), 1)], deletes)
+    t.rebalance(1)
+    
+    assert snapshot.getSize() == 300 and snapshot.getVersion() == 0
+    for key in p: assert snapshot.find(key) == p[key]
+    assert snapshot.find((200, 200, 200)) == None
+    assert t.getSize() == 201 and t.getVersion() == 2
+    
+    snapshot.update([], list(p))
+    snapshot.rebuild()
+    assert snapshot.getSize() == 300 and snapshot.getVersion() == 0
+    
+    # a tree can't be emptied, or take keys of other dimensions
+    t.update([], list(t.countRadius((0, 0, 0), 1000)) + [(200, 200, 200)])
+    t.update([((1, 2), 0)])
+    assert t.getSize() == 201 and t.getVersion() == 2
+
+# readers searching snapshots see the same tree the whole time while another 
+# thread changes it
+def test_update_threads():
+    
+    p = dict(generatePoints(2, 2000, True, 0, 1000))
+    t = BallTree(list(p.items()))
+    done, errors = threading.Event(), []
+    
+    # every point of a snapshot is within reach of a point off to the side
+    def read():
+        while not done.is_set():
+            snapshot = t.snapshot()
+            found = snapshot.countRadius((-1, -1), 5000)
+            if len(found) != snapshot.getSize() or snapshot.countRadius((-1, -1), 5000) != found:
+                errors.append(snapshot)
+    
+    readers = [threading.Thread(target=read) for i in range(3)]
+    for reader in readers: reader.start()
+    
+    for i in range(20):
+        keys = random.sample(list(p), 20)
+        t.update([(generateKey(2, True, 0, 1000), i) for i in range(20)], keys)
+        for key in keys: del p[key]
+    
+    done.set()
+    for reader in readers: reader.join()
+    
+    assert not errors and t.getVersion() == 20
+
+# a query the tree is changed in the middle of answers for the tree as it was 
+# when the query started, and the next query sees the change
+def test_update_mid_query():
+    
+    p = dict(generatePoints(2, 150, True, 0, 100))
+    t = BallTree(list(p.items()))
+    old, deletes = dict(p), random.sample(list(p), 50)
+    point = random.choice([key for key in p if key not in deletes])
+    
+    # changes the tree the first time the wrapped step of a query runs
+    def changing(step, inserts=[((500, 500), 1)], deletes=deletes):
+        def wrapped(*args):
+            if t.getVersion() == 0: t.update(inserts, deletes)
+            return step(*args)
+        return wrapped
+    
+    t._BallTree__nearestRadii = changing(t._BallTree__nearestRadii)
+    assert t.reverseNearestNeighbors(point, 2) == bruteReverse(list(old), point, 2)
+    for key in deletes: del p[key]
+    p[(500, 500)] = 1
+    assert t.reverseNearestNeighbors(point, 2) == bruteReverse(list(p), point, 2)
+    
+    t = BallTree(list(old.items()))
+    t._BallTree__kde = changing(t._BallTree__kde)
+    density = BallTree(list(old.items())).kernelDensity([point], 10)
+    assert math.isclose(t.kernelDensity([point], 10)[0], density[0])
+    
+    # the point's own data is left out of the aggregate even when the point is 
+    # given new data or deleted in the middle of it
+    for inserts, removed in (([((500, 500), 1)], deletes), ([(point, -1000)], []), ([], [point])):
+        for radius in (30, 1000):
+            
+            t = BallTree(list(old.items()))
+            t._BallTree__aggregate = changing(t._BallTree__aggregate, inserts, removed)
+            inside = [old[key] for key in old if key != point and bruteDist(point, key) < radius**2]
+            assert math.isclose(t.aggregateRadius(point, radius), sum(inside), abs_tol=1e-9)
+
+############ BOX QUERIES ###################################################
+
+# points inside random boxes, small and large, match a brute force search
+def test_box():
+    
+    for i in range(10):
+        
+        dim = random.randint(2,6)
+        dType = random.choice([True, False])
+        p = generatePoints(dim, random.randint(10, 500), dType, 0, 100)
+        t = BallTree(p)
+        
+        for i in range(5):
+            
+            # int corners put many points on the edges of the box
+            corners = [generateKey(dim, dType, -20, 120) for i in range(2)]
+            lo = tuple(min(c[j] for c in corners) for j in range(dim))
+            hi = tuple(max(c[j] for c in corners) for j in range(dim))
+            
+            brute = sorted(key for key, data in p 
+                           if all(lo[j] <= key[j] <= hi[j] for j in range(dim)))
+            assert t.queryBox(lo, hi) == sorted(set(brute))
+        
+        # a box around everything holds every point
+        assert len(t.queryBox((-1,) * dim, (101,) * dim)) == t.getSize()
+
+# boxes of the wrong dimensions give back None, and empty boxes hold nothing
+def test_box_invalid():
+    
+    p = generatePoints(3, 50, True, 0, 100)
+    t = BallTree(p)
+    
+    assert t.queryBox((0, 0), (100, 100, 100)) == None
+    assert t.queryBox((0, 0, 0), (100, 100)) == None
+    assert t.queryBox((100, 100, 100), (0, 0, 0)) == []
+
+############ SHARDED BALL TREE #############################################
+
+# sharded trees, split spatially or by hash, answer queries like a single tree
+def test_sharded():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,6)
+        dType = random.choice([True, False])
+        p = generatePoints(dim, random.randint(10, 500), dType, -10000, 10000)
+        t = BallTree(p)
+        
+        for partition in ["spatial", "hash"]:
+            
+            s = ShardedBallTree(p, random.randint(1, 8), partition)
+            assert s.getSize() == t.getSize()
+            
+            for point in p[:20]: assert s.find(point[0]) == point[1]
+            assert s.find(generateKey(dim + 1, dType)) == None
+            
+            for i in range(5):
+                key = random.choice([random.choice(p)[0], generateKey(dim, dType, -10000, 10000)])
+                n = random.randint(1, len(p) + 1)
+                radius = random.randint(1000, 10000)
+                assert s.nearestNeighbors(key, n) == t.nearestNeighbors(key, n)
+                assert s.countRadius(key, radius) == t.countRadius(key, radius)
+
+# shards in worker processes give the same answers
+def test_sharded_processes():
+    
+    p = generatePoints(3, 300, True, -10000, 10000)
+    t = BallTree(p)
+    s = ShardedBallTree(p, 3, processes=True)
+    
+    assert s.getSize() == t.getSize() and s.getShardCount() == 3
+    for point in p[:10]: assert s.find(point[0]) == point[1]
+    
+    for i in range(5):
+        key = generateKey(3, True, -10000, 10000)
+        assert s.nearestNeighbors(key, 10) == t.nearestNeighbors(key, 10)
+        assert s.countRadius(key, 5000) == t.countRadius(key, 5000)
+        
+    s.close()
+
+############ MAPPED BALL TREE ##############################################
+
+# a saved tree mapped back in answers queries like the tree that was saved
+def test_mapped_save(tmp_path):
+    
+    for dtype in [None, "float32", "int32"]:
+        
+        dim = random.randint(2,6)
+        p = generatePoints(dim, random.randint(10, 500), False, -10000, 10000)
+        t = BallTree(p, dtype)
+        t.save(str(tmp_path / "tree.bt"))
+        m = MappedBallTree(str(tmp_path / "tree.bt"))
+        
+        assert m.getSize() == t.getSize() and m.getRadius() == t.getRadius()
+        for point in p: assert m.find(point[0]) == point[1]
+        assert m.find(generateKey(dim + 1, False)) == None
+        
+        for i in range(5):
+            key = random.choice([random.choice(p)[0], generateKey(dim, False, -10000, 10000)])
+            n = random.randint(1, len(p) + 1)
+            assert m.nearestNeighbors(key, n) == t.nearestNeighbors(key, n)
+            assert m.countRadius(key, 5000) == t.countRadius(key, 5000)
+        
+        m.close()
+    
+    # files that aren't Ball Trees, empty, too short, or another kind, can't be mapped
+    for contents in (b"", b"BT", b"1,2,3\n" * 100):
+        (tmp_path / "other.bt").write_bytes(contents)
+        with pytest.raises(ValueError): MappedBallTree(str(tmp_path / "other.bt"))
+
+# every order the Balls can be laid out in maps back to the same tree
+def test_mapped_orders(tmp_path):
+    
+    dim = random.randint(2,6)
+    p = generatePoints(dim, random.randint(600, 2000), True, -10000, 10000)
+    t = BallTree(p, lazy=True)
+    
+    for order in ["dfs", "bfs", "veb"]:
+        
+        t.save(str(tmp_path / "tree.bt"), order)
+        m = MappedBallTree(str(tmp_path / "tree.bt"))
+        
+        assert m.getSize() == t.getSize() and m.getRadius() == t.getRadius()
+        for point in p: assert m.find(point[0]) == point[1]
+        
+        for i in range(5):
+            key = random.choice([random.choice(p)[0], generateKey(dim, True, -10000, 10000)])
+            n = random.randint(1, len(p) + 1)
+            assert m.nearestNeighbors(key, n) == t.nearestNeighbors(key, n)
+            assert m.countRadius(key, 5000) == t.countRadius(key, 5000)
+        
+        m.close()
+        
+        block = t.share(order=order)
+        m = MappedBallTree.attach(block.name)
+        key = generateKey(dim, True, -10000, 10000)
+        assert m.nearestNeighbors(key, 10) == t.nearestNeighbors(key, 10)
+        m.close()
+        block.close()
+        block.unlink()
+    
+    assert t.share(order="random") == None
+
+# a tree split along directions can still be searched for keys once mapped
+def test_mapped_split(tmp_path):
+    
+    dim = random.randint(2,12)
+    p = generatePoints(dim, random.randint(10, 1000), True, -10000, 10000)
+    t = BallTree(p, split=random.choice(["pca", "random", "farthest"]))
+    t.save(str(tmp_path / "tree.bt"))
+    m = MappedBallTree(str(tmp_path / "tree.bt"))
+    
+    for point in p: assert m.find(point[0]) == point[1]
+    assert m.find(generateKey(dim, True, -10000, 10000)) == None
+    key = random.choice(p)[0]
+    assert m.nearestNeighbors(key, 10) == t.nearestNeighbors(key, 10)
+    
+    m.close()
+
+# a quantized file answers exactly like the full one, with keys a byte per dimension
+def test_mapped_quantized(tmp_path):
+    
+    for i in range(5):
+        
+        dim = random.randint(1,8)
+        floats = random.choice([True, False])
+        p = generatePoints(dim, random.randint(1, 500), floats, -10000, 10000)
+        t = BallTree(p, random.choice([None, "float32", "float64"] if floats else ["int32"]), 
+                     split=random.choice(["spread", "pca"]))
+        
+        order = random.choice(["dfs", "bfs", "veb"])
+        t.save(str(tmp_path / "tree.bt"), order)
+        t.save(str(tmp_path / "codes.bt"), order, quantize=True)
+        m, q = MappedBallTree(str(tmp_path / "tree.bt")), MappedBallTree(str(tmp_path / "codes.bt"))
+        
+        assert q.getSize() == len(p) and q.getDtype() == m.getDtype()
+        assert (tmp_path / "codes.bt.keys").stat().st_size == len(p) * dim * (8 if t.getDtype() in (None, "float64") else 4)
+        for point in p: assert q.find(point[0]) == m.find(point[0])
+        
+        for j in range(5):
+            key = random.choice([random.choice(p)[0], generateKey(dim, True, -10000, 10000)])
+            n, radius = random.randint(1, len(p)), random.uniform(100, 10000)
+            assert q.nearestNeighbors(key, n) == m.nearestNeighbors(key, n)
+            assert q.countRadius(key, radius) == m.countRadius(key, radius)
+        
+        m.close()
+        q.close()
+
+# answers a query on a shared tree from another process
+def queryShared(name, key, n, answers):
+    
+    m = MappedBallTree.attach(name)
+    answers.put((m.getSize(), m.nearestNeighbors(key, n)))
+    m.close()
+
+# a tree published to shared memory is queried from other processes without copying
+def test_mapped_shared():
+    
+    for dtype in [None, "float32"]:
+        
+        dim = random.randint(2,6)
+        p = generatePoints(dim, random.randint(10, 500), False, -10000, 10000)
+        t = BallTree(p, dtype)
+        block = t.share()
+        
+        # attached in this process
+        m = MappedBallTree.attach(block.name)
+        assert m.getSize() == t.getSize()
+        for point in p: assert m.find(point[0]) == point[1]
+        key = generateKey(dim, False, -10000, 10000)
+        assert m.nearestNeighbors(key, 10) == t.nearestNeighbors(key, 10)
+        m.close()
+        
+        # and in another one
+        answers = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=queryShared, args=(block.name, key, 10, answers))
+        worker.start()
+        assert answers.get() == (t.getSize(), t.nearestNeighbors(key, 10))
+        worker.join()
+        
+        block.close()
+        block.unlink()
+
+# a tree built out of core, a few partitions at a time, holds every point in the CSV
+def test_out_of_core(tmp_path):
+    
+    for i in range(3):
+        
+        dim = random.randint(2,6)
+        p = generatePoints(dim, random.randint(100, 1000), True, -10000, 10000)
+        BallTree(p).export(str(tmp_path / "points.csv"))
+        t = BallTree(str(tmp_path / "points.csv"))
+        
+        m = BallTree.buildOutOfCore(str(tmp_path / "points.csv"), str(tmp_path / "tree.bt"), 
+                                    random.randint(10, 200), sampleSize=random.randint(20, 200),
+                                    order=random.choice(["dfs", "bfs", "veb"]))
+        
+        assert m.getSize() == t.getSize()
+        for point in p: assert m.find(point[0]) == t.find(point[0])
+        
+        for i in range(5):
+            key = random.choice([random.choice(p)[0], generateKey(dim, True, -10000, 10000)])
+            n = random.randint(1, len(p) + 1)
+            assert m.nearestNeighbors(key, n) == t.nearestNeighbors(key, n)
+            assert m.countRadius(key, 5000) == t.countRadius(key, 5000)
+            
+        m.close()
+    
+    # partitions need at least a point, and splitting them at least two
+    for maxPoints, sampleSize in ((0, 100), (10, 1), (10, 0)):
+        assert BallTree.buildOutOfCore(str(tmp_path / "points.csv"), str(tmp_path / "tree.bt"), 
+                                       maxPoints, sampleSize=sampleSize) == None
+
+# partitions stay within maxPoints even when the sample splits clustered points
+# badly, and there can be more of them than files a process may have open
+def test_out_of_core_partitions(tmp_path, monkeypatch):
+    
+    spread = list(dict(generatePoints(2, 1500, True, -10000, 10000)).items())
+    clustered = generatePoints(2, 1400, True, 0, 10) + generatePoints(2, 100, True, -10000, 10000)
+    clustered = list(dict(clustered).items())
+    
+    # the size of every partition built in memory
+    sizes = []
+    flatColumns = BallTree._BallTree__flatColumns
+    def spy(b, *args):
+        sizes.append(b.count)
+        return flatColumns(b, *args)
+    monkeypatch.setattr(BallTree, "_BallTree__flatColumns", spy)
+    
+    # a sample of every spread point makes 150 partitions straight away, and a 
+    # small sample of the clustered points makes some that have to be split again
+    for p, sampleSize in ((spread, 1500), (clustered, 15)):
+        
+        BallTree(p).export(str(tmp_path / "points.csv"))
+        t = BallTree(str(tmp_path / "points.csv"))
+        sizes.clear()
+        
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(64, hard), hard))
+        try: 
+            m = BallTree.buildOutOfCore(str(tmp_path / "points.csv"), str(tmp_path / "tree.bt"), 10, 
+                                        sampleSize=sampleSize)
+        finally: resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        
+        assert max(sizes) <= 10 and len(sizes) > 64
+        assert m.getSize() == t.getSize()
+        for point in p: assert m.find(point[0]) == t.find(point[0])
+        key = generateKey(2, True, 0, 10)
+        assert m.nearestNeighbors(key, 50) == t.nearestNeighbors(key, 50)
+        m.close()
+
+############ KERNEL DENSITY ################################################
+
+# brute force kernel density estimate, to compare with the Ball Tree
+def bruteKernelDensity(p, point, bandwidth, kernel):
+    
+    dim = len(point)
+    total = 0
+    for key, data in p:
+        u = sum((point[i] - key[i])**2 for i in range(dim)) / bandwidth**2
+        if kernel == "gaussian": total += math.exp(-0.5 * u)
+        elif kernel == "tophat": total += 1 if u < 1 else 0
+        else: total += 1 - u if u < 1 else 0
+        
+    if kernel == "gaussian": norm = (2 * math.pi) ** (-dim / 2)
+    else:
+        norm = math.gamma(dim / 2 + 1) / math.pi ** (dim / 2)
+        if kernel == "epanechnikov": norm *= (dim + 2) / 2
+    return norm * total / (bandwidth ** dim * len(p))
+
+# with no tolerance the estimates match the brute force sum for every kernel
+def test_kde_exact():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,4)
+        p = generatePoints(dim, random.randint(10, 300), True, 0, 100)
+        t = BallTree(p)
+        
+        queries = [generateKey(dim, True, 0, 100) for i in range(5)] + [p[0][0]]
+        bandwidth = random.uniform(1, 30)
+        
+        for kernel in ["gaussian", "tophat", "epanechnikov"]:
+            ans = t.kernelDensity(queries, bandwidth, kernel)
+            for j in range(len(queries)):
+                exact = bruteKernelDensity(p, queries[j], bandwidth, kernel)
+                assert math.isclose(ans[j], exact, rel_tol=1e-9, abs_tol=1e-300)
+
+# with a tolerance the estimates stay within it
+def test_kde_tolerance():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,4)
+        p = generatePoints(dim, random.randint(100, 500), True, 0, 100)
+        t = BallTree(p)
+        
+        queries = [generateKey(dim, True, 0, 100) for i in range(5)]
+        bandwidth = random.uniform(1, 30)
+        
+        for kernel in ["gaussian", "tophat", "epanechnikov"]:
+            
+            exact = [bruteKernelDensity(p, q, bandwidth, kernel) for q in queries]
+            atol = max(exact) * 1e-3
+            
+            for ans, ex in zip(t.kernelDensity(queries, bandwidth, kernel, rtol=0.01), exact):
+                assert abs(ans - ex) <= 0.01 * ex * (1 + 1e-9)
+            for ans, ex in zip(t.kernelDensity(queries, bandwidth, kernel, atol=atol), exact):
+                assert abs(ans - ex) <= atol * (1 + 1e-9)
+
+# bad bandwidths, kernels, and points give back None
+def test_kde_invalid():
+    
+    p = generatePoints(3, 50, True, 0, 100)
+    t = BallTree(p)
+    
+    assert t.kernelDensity([p[0][0]], 0) == None
+    assert t.kernelDensity([p[0][0]], 1, "triangle") == None
+    assert t.kernelDensity([p[0][0][:-1]], 1) == None
+    assert t.kernelDensity([p[0][0]], 1, atol=-1) == None
+
+
+############ TWO POINT CORRELATION #########################################
+
+# brute force pair counts, to compare with the Ball Tree
+def brutePairCounts(p, queries, radii):
+    
+    dists = [sum((q[i] - key[i])**2 for i in range(len(q))) for q in queries for key, data in p]
+    return [sum(1 for d in dists if d <= r**2) for r in radii]
+
+# pair counts between query points and the tree match the brute force counts
+def test_two_point_queries():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,5)
+        dType = random.choice([True, False])
+        p = list(dict(generatePoints(dim, random.randint(10, 300), dType, 0, 100)).items())
+        t = BallTree(p)
+        
+        # query points may repeat, and each one counts
+        queries = [key for key, data in generatePoints(dim, random.randint(1, 50), dType, 0, 100)]
+        queries += queries[:random.randint(0, len(queries))]
+        radii = sorted(random.uniform(0, 150) for i in range(random.randint(1, 10)))
+        
+        assert t.twoPointCorrelation(queries, radii) == brutePairCounts(p, queries, radii)
+    
+    # unlike countRadius, pairs exactly on a radius count, and so do pairs at 
+    # distance 0 (a query point that's in the tree)
+    t = BallTree([((0, 0), 1), ((3, 4), 1), ((6, 8), 1)])
+    assert t.twoPointCorrelation([(0, 0)], [0, 5, 10]) == [1, 2, 3]
+    assert t.countRadius((0, 0), 5) == []
+
+# pair counts of a tree with itself include each point paired with itself
+def test_two_point_self():
+    
+    for i in range(5):
+        
+        dim = random.randint(2,5)
+        # int keys put many pairs exactly on the radii (but may repeat, which the
+        # tree doesn't support)
+        p = list(dict(generatePoints(dim, random.randint(10, 300), False, 0, 30)).items())
+        t = BallTree(p)
+        
+        radii = sorted(random.randint(0, 40) for i in range(random.randint(1, 10)))
+        keys = [key for key, data in p]
+        
+        assert t.twoPointCorrelation(t, radii) == brutePairCounts(p, keys, radii)
+        assert t.twoPointCorrelation(t, [0])[0] == len(p)
+
+# radii out of order and mismatched dimensions give back None
+def test_two_point_invalid():
+    
+    p = generatePoints(3, 50, True, 0, 100)
+    t = BallTree(p)
+    
+    assert t.twoPointCorrelation([p[0][0]], [2, 1]) == None
+    assert t.twoPointCorrelation([p[0][0][:-1]], [1, 2]) == None
+    assert t.twoPointCorrelation([], [1, 2]) == [0, 0]
+
+
+############ DBSCAN ########################################################
+
+# brute force DBSCAN: everyone's neighbors, the core points, and the cluster
+# each core point ends up in
+def bruteDbscan(p, eps, minSamples):
+    
+    keys = [key for key, data in p]
+    neighbors = {}
+    for key in keys:
+        neighbors[key] = [other for other in keys if
+                          sum((a - b)**2 for a, b in zip(key, other)) <= eps**2]
+    cores = {key for key in keys if len(neighbors[key]) >= minSamples}
+    
+    labels = {}
+    for key in keys:
+        if key in cores and key not in labels:
+            labels[key] = len(set(labels.values()))
+            stack = [key]
+            while stack:
+                for other in neighbors[stack.pop()]:
+                    if other in cores and other not in labels:
+                        labels[other] = labels[key]
+                        stack.append(other)
+    
+    return neighbors, cores, labels
+
+# core points are clustered exactly as by brute force (up to numbering), and
+# every other point is noise or in a cluster of a core point it neighbors
+def test_dbscan():
+    
+    for i in range(10):
+        
+        dim = random.randint(1, 4)
+        keys, data = generateArrays(dim, random.randint(5, 300),
+                                    random.choice(["clusters", "uniform", "skewed"]),
+                                    random.choice([True, False]), 0, 100)
+        p = [(tuple(keys[j*dim:(j+1)*dim]), data[j]) for j in range(len(data))]
+        t = BallTree(p, tight=random.choice([True, False]))
+        
+        eps, minSamples = random.uniform(1, 20), random.randint(1, 10)
+        neighbors, cores, labels = bruteDbscan(p, eps, minSamples)
+        got = t.dbscan(eps, minSamples)
+        
+        assert set(got) == set(neighbors)
+        
+        clusters = {}
+        for key in cores:
+            assert clusters.setdefault(labels[key], got[key]) == got[key]
+        assert len(set(clusters.values())) == len(clusters)
+        assert set(clusters.values()) == set(range(len(clusters)))
+        
+        for key in neighbors:
+            if key not in cores:
+                near = {clusters[labels[other]] for other in neighbors[key] if other in cores}
+                assert got[key] in near if near else got[key] == -1
+
+# a nonpositive eps or minSamples gives back None
+def test_dbscan_invalid():
+    
+    t = BallTree(generatePoints(2, 50, True, 0, 100))
+    
+    assert t.dbscan(0) == None
+    assert t.dbscan(1, 0) == None
+    assert set(t.dbscan(1000, 1).values()) == {0}
+
 pytest.main(["-v", "-s", "test_BallTree.py"])
 